@@ -0,0 +1,165 @@
+"""
+Post counts per month and per category for the navigation blocks.
+
+The ArchiveMonth and CategoryCount tables are adjusted by the post
+signals as posts are added, moved and deleted, and rebuilt from the post
+table by the `rebuild_aggregates` command. The navigation built from them
+is kept in the page cache backend, so rendering it is a single cache
+lookup. Changes refresh it at once in a shared cache backend; with a
+per-process one, other workers reload it after BLOGENGINE_NAVIGATION_TTL
+seconds.
+"""
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from blogengine import pagecache
+from blogengine.models import ArchiveMonth, CategoryCount, Post
+
+NAVIGATION_KEY = 'blogengine:navigation'
+
+
+def archive_month(pub_date):
+    """
+    Return the (year, month) a post is archived under, in the current
+    time zone like the archive pages.
+    """
+    if settings.USE_TZ and timezone.is_aware(pub_date):
+        pub_date = timezone.localtime(pub_date)
+
+    return pub_date.year, pub_date.month
+
+
+def archive_tag(year, month=None):
+    """
+    Return the page cache tag of the archive pages for a year or month.
+    """
+    if month is None:
+        return 'archive:{0}'.format(year)
+
+    return 'archive:{0}-{1:02d}'.format(year, month)
+
+
+def archive_tags(pub_date):
+    """
+    Return the tags of the year and month archives a post appears in.
+    """
+    year, month = archive_month(pub_date)
+
+    return [archive_tag(year), archive_tag(year, month)]
+
+
+def tally(queryset):
+    """
+    Count the posts of queryset by month and by category id.
+    """
+    months = Counter()
+    categories = Counter()
+
+    for pub_date, category_id in queryset.values_list('pub_date', 'category_id').iterator():
+        months[archive_month(pub_date)] += 1
+        if category_id is not None:
+            categories[category_id] += 1
+
+    return months, categories
+
+
+def _add(queryset, lookup, delta):
+    if queryset.filter(**lookup).update(post_count=F('post_count') + delta):
+        if delta < 0:
+            queryset.filter(post_count__lte=0, **lookup).delete()
+        return
+
+    if delta > 0:
+        try:
+            with transaction.atomic(using=queryset.db):
+                queryset.create(post_count=delta, **lookup)
+        except IntegrityError:
+            # Created by a concurrent save
+            queryset.filter(**lookup).update(post_count=F('post_count') + delta)
+
+
+def count_posts(months, categories, using='default'):
+    """
+    Add the given changes, Counters of (year, month) and of category id,
+    to the aggregate tables.
+    """
+    months = dict((month, delta) for month, delta in months.items() if delta)
+    categories = dict((pk, delta) for pk, delta in categories.items() if delta and pk is not None)
+
+    if not months and not categories:
+        return
+
+    with transaction.atomic(using=using):
+        for (year, month), delta in months.items():
+            _add(ArchiveMonth.objects.using(using), {'year': year, 'month': month}, delta)
+        for category_id, delta in categories.items():
+            _add(CategoryCount.objects.using(using), {'category_id': category_id}, delta)
+
+    refresh_navigation(using)
+
+
+def rebuild(using='default'):
+    """
+    Recount every post, replacing the aggregate tables.
+    """
+    months, categories = tally(Post.objects.using(using).all())
+
+    with transaction.atomic(using=using):
+        ArchiveMonth.objects.using(using).all().delete()
+        CategoryCount.objects.using(using).all().delete()
+        ArchiveMonth.objects.using(using).bulk_create([
+            ArchiveMonth(year=year, month=month, post_count=count) for (year, month), count in months.items()
+        ])
+        CategoryCount.objects.using(using).bulk_create([
+            CategoryCount(category_id=category_id, post_count=count) for category_id, count in categories.items()
+        ])
+
+    refresh_navigation(using)
+
+    return months, categories
+
+
+def load_navigation(using='default'):
+    months = [
+        (datetime.date(year, month, 1), count)
+        for year, month, count in (ArchiveMonth.objects.using(using)
+                                                       .filter(post_count__gt=0)
+                                                       .values_list('year', 'month', 'post_count'))
+    ]
+    categories = list(CategoryCount.objects.using(using)
+                                           .filter(post_count__gt=0)
+                                           .order_by('category__name')
+                                           .values_list('category__name', 'category__slug', 'post_count'))
+
+    return {'months': months, 'categories': categories}
+
+
+def navigation_timeout():
+    return getattr(settings, 'BLOGENGINE_NAVIGATION_TTL', 60)
+
+
+def refresh_navigation(using='default'):
+    """
+    Store the navigation as it is now and invalidate the pages showing it.
+    """
+    pagecache.get_cache().set(NAVIGATION_KEY, load_navigation(using), navigation_timeout())
+    pagecache.invalidate('navigation')
+
+
+def navigation():
+    """
+    Return the months and categories with their post counts.
+    """
+    cache = pagecache.get_cache()
+    found = cache.get(NAVIGATION_KEY)
+
+    if found is None:
+        found = load_navigation()
+        cache.set(NAVIGATION_KEY, found, navigation_timeout())
+
+    return found
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class BlogEngineConfig(AppConfig):
+    name = 'blogengine'
+    verbose_name = 'Blog engine'
+
+    def ready(self):
+        # Connect the model signal receivers
+        import blogengine.signals  # noqa
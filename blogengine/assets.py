@@ -0,0 +1,264 @@
+"""
+Static asset pipeline: bundles, fingerprints and precompressed variants.
+
+BundleStaticFilesStorage is a ManifestStaticFilesStorage that, during
+collectstatic, concatenates and minifies the stylesheets and scripts
+base.html uses into BUNDLES, fingerprints every file as its parent does,
+and writes a gzip variant (and a Brotli one when the brotli package is
+installed) next to each compressible file. The variants are listed in
+the manifest.
+
+StaticFilesApplication serves STATIC_ROOT in front of the Django WSGI
+application, picking the smallest variant the client accepts and caching
+fingerprinted files for a year as immutable.
+"""
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from collections import OrderedDict
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import http_date
+
+from blogengine import compression
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+BUNDLES = OrderedDict([
+    ('blogengine/bundles/blog.css', (
+        'bower_components/html5-boilerplate/css/normalize.css',
+        'bower_components/html5-boilerplate/css/main.css',
+        'bower_components/bootstrap/dist/css/bootstrap.min.css',
+        'bower_components/bootstrap/dist/css/bootstrap-theme.min.css',
+    )),
+    ('blogengine/bundles/blog.js', (
+        'bower_components/html5-boilerplate/js/plugins.js',
+        'bower_components/bootstrap/dist/js/bootstrap.min.js',
+    )),
+])
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.xml', '.json', '.map', '.html', '.eot', '.ttf', '.otf')
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)\s*(.*?)\s*\1\s*\)''')
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+
+
+def minify_css(css):
+    if rcssmin is not None:
+        return rcssmin.cssmin(css)
+
+    # Conservative: keeps /*! licence */ comments and does not look inside
+    # strings, which the bundled stylesheets only use for url()s and fonts
+    css = CSS_COMMENT.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = css.replace(';}', '}')
+
+    return css.strip()
+
+
+def minify_js(js):
+    if rjsmin is not None:
+        return rjsmin.jsmin(js)
+
+    # Without rjsmin scripts are only concatenated
+    return js.strip()
+
+
+def rebase_css_urls(css, source, bundle):
+    """
+    Rewrite the relative url()s of a stylesheet at source so they work
+    from bundle.
+    """
+    source_dir = posixpath.dirname(source)
+    bundle_dir = posixpath.dirname(bundle)
+
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(('/', '#', 'data:', 'http:', 'https:')) or '//' in url:
+            return match.group(0)
+
+        path = posixpath.normpath(posixpath.join(source_dir, url))
+        return 'url({0}{1}{0})'.format(quote, posixpath.relpath(path, bundle_dir))
+
+    return CSS_URL.sub(rebase, css)
+
+
+def build_bundle(name, sources, read):
+    """
+    Return the minified contents of a bundle. read returns the text of a
+    source file.
+    """
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(rebase_css_urls(read(source), source, name)) for source in sources)
+
+    # The semicolon keeps a script without a trailing one from running
+    # into the next
+    return '\n;'.join(minify_js(read(source)) for source in sources)
+
+
+def compress(content):
+    """
+    Return the (encoding, suffix, data) variants of content that are
+    smaller than it.
+    """
+    suffixes = dict(compression.SUFFIXES)
+    variants = [(encoding, suffixes[encoding], compression.encode(content, encoding))
+                for encoding in compression.encodings()]
+
+    return [variant for variant in variants if len(variant[2]) < len(content)]
+
+
+class BundleStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            for name, sources in BUNDLES.items():
+                contents = build_bundle(name, sources, lambda source: self.read_source(paths, source))
+                if self.exists(name):
+                    self.delete(name)
+                self._save(name, ContentFile(force_bytes(contents)))
+                paths[name] = (self, name)
+
+        self.compressed_files = OrderedDict()
+
+        for processed in super(BundleStaticFilesStorage, self).post_process(paths, dry_run, **options):
+            yield processed
+
+    def read_source(self, paths, source):
+        if source in paths:
+            storage, path = paths[source]
+            with storage.open(path) as source_file:
+                return force_text(source_file.read())
+
+        found = finders.find(source)
+        if found is None:
+            raise ValueError("The bundled file '{0}' could not be found; run bower install.".format(source))
+
+        with open(found, 'rb') as source_file:
+            return force_text(source_file.read())
+
+    def compress_files(self):
+        compressed_files = OrderedDict()
+
+        for name in set(self.hashed_files.values()):
+            if not name.endswith(COMPRESSIBLE):
+                continue
+
+            with self.open(name) as original:
+                content = original.read()
+
+            encodings = []
+            for encoding, suffix, data in compress(content):
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(data))
+                encodings.append(encoding)
+
+            if encodings:
+                compressed_files[name] = encodings
+
+        return compressed_files
+
+    def save_manifest(self):
+        if self.hashed_files:
+            self.compressed_files = self.compress_files()
+
+        payload = {
+            'paths': self.hashed_files,
+            'version': self.manifest_version,
+            'compressed': getattr(self, 'compressed_files', {}),
+        }
+        if self.exists(self.manifest_name):
+            self.delete(self.manifest_name)
+        self._save(self.manifest_name, ContentFile(json.dumps(payload).encode('utf-8')))
+
+
+class StaticFilesApplication(object):
+    """
+    WSGI middleware serving collected static files from STATIC_ROOT, and
+    passing every other request to the wrapped application.
+    """
+    immutable_max_age = 365 * 24 * 60 * 60
+    max_age = 60
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = os.path.abspath(root or settings.STATIC_ROOT)
+        self.prefix = prefix or settings.STATIC_URL
+        self.fingerprinted, self.encodings = self.load_manifest()
+
+    def load_manifest(self):
+        path = os.path.join(self.root, getattr(ManifestStaticFilesStorage, 'manifest_name', 'staticfiles.json'))
+
+        try:
+            with open(path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, ValueError):
+            return set(), {}
+
+        return set(manifest.get('paths', {}).values()), manifest.get('compressed', {})
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix) or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.application(environ, start_response)
+
+        name = posixpath.normpath(path[len(self.prefix):]).lstrip('/')
+        filename = os.path.abspath(os.path.join(self.root, *name.split('/')))
+        if not filename.startswith(self.root + os.sep) or not os.path.isfile(filename):
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        headers = [('Vary', 'Accept-Encoding')]
+
+        available = [encoding for encoding, suffix in compression.SUFFIXES if encoding in self.encodings.get(name, ())]
+        encoding = compression.negotiate(environ.get('HTTP_ACCEPT_ENCODING'), available)
+        if encoding is not None:
+            filename += dict(compression.SUFFIXES)[encoding]
+            headers.append(('Content-Encoding', encoding))
+
+        stat = os.stat(filename)
+        etag = '"{0:x}-{1:x}"'.format(int(stat.st_mtime), stat.st_size)
+
+        if name in self.fingerprinted:
+            headers.append(('Cache-Control', 'public, max-age={0}, immutable'.format(self.immutable_max_age)))
+        else:
+            headers.append(('Cache-Control', 'public, max-age={0}'.format(self.max_age)))
+        headers += [
+            ('Content-Type', content_type),
+            ('ETag', etag),
+            ('Last-Modified', http_date(stat.st_mtime)),
+        ]
+
+        if environ.get('HTTP_IF_NONE_MATCH') == etag:
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.append(('Content-Length', str(stat.st_size)))
+        start_response('200 OK', [(str(key), str(value)) for key, value in headers])
+
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+
+        static_file = open(filename, 'rb')
+        if 'wsgi.file_wrapper' in environ:
+            return environ['wsgi.file_wrapper'](static_file, 64 * 1024)
+
+        # Closed by the server once the response is sent
+        return FileWrapper(static_file, 64 * 1024)
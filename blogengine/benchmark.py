@@ -0,0 +1,278 @@
+"""
+Helpers for the benchmark management commands.
+
+Benchmarks run inside a transaction that is rolled back at the end, so the
+rows they generate never outlive the run.
+"""
+import contextlib
+import datetime
+import random
+import sys
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from blogengine import instrumentation
+from blogengine.models import Category, Post
+from blogengine.pagination import KeysetPaginator
+from blogengine.rendering import render_markdown, source_hash
+
+BENCHMARK_TEXT = 'A benchmark post with [a link](http://example.com/) and *some* emphasis.'
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def rolled_back():
+    """
+    Run the block in a transaction that is always rolled back.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback()
+    except Rollback:
+        pass
+
+
+def seed_posts(start, stop, author, site, batch_size=1000, text=None):
+    """
+    Bulk create posts numbered start to stop - 1, one minute apart.
+
+    text, if given, is called with the post number to make its text. Those
+    posts are left without rendered HTML.
+    """
+    rendered_text = render_markdown(BENCHMARK_TEXT)
+    text_hash = source_hash(BENCHMARK_TEXT)
+    newest = timezone.now()
+
+    for batch_start in range(start, stop, batch_size):
+        Post.objects.bulk_create([
+            Post(
+                title='Benchmark post {0}'.format(number),
+                slug='benchmark-post-{0}'.format(number),
+                pub_date=newest - datetime.timedelta(minutes=number),
+                text=BENCHMARK_TEXT if text is None else text(number),
+                rendered_text=rendered_text if text is None else '',
+                text_hash=text_hash if text is None else '',
+                author=author,
+                site=site
+            )
+            for number in range(batch_start, min(batch_start + batch_size, stop))
+        ])
+
+
+def time_requests(client, paths):
+    """
+    Fetch each path with the test client and return the timings in seconds.
+    """
+    timings = []
+
+    for path in paths:
+        started = time.time()
+        response = client.get(path)
+        timings.append(time.time() - started)
+
+        if response.status_code != 200:
+            raise AssertionError('{0} returned {1}'.format(path, response.status_code))
+
+    return timings
+
+
+def percentile(samples, pct):
+    """
+    Return the pct-th percentile of the samples, by nearest rank.
+    """
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class ClientDriver(object):
+    """
+    Sends requests through the test client.
+    """
+    def __init__(self):
+        from django.test import Client
+        self.client = Client()
+
+    def get(self, path, query_string=''):
+        return self.client.get(path, QueryDict(query_string)).status_code
+
+
+class WSGIDriver(object):
+    """
+    Calls the WSGI handler directly, as a server would.
+    """
+    def __init__(self):
+        self.handler = WSGIHandler()
+
+    def get(self, path, query_string=''):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multiprocess': True,
+            'wsgi.multithread': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+
+        def start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split(' ', 1)[0]))
+
+        result = self.handler(environ, start_response)
+        try:
+            for chunk in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        return status[0]
+
+
+def route_samples(samples, deep_page=1000, per_page=5, seed=0):
+    """
+    Return an ordered dict of route name to (path, query string) samples
+    drawn from the database.
+    """
+    from blogengine.views import PostListView
+
+    rng = random.Random(seed)
+    routes = OrderedDict()
+
+    routes['index'] = [('/', '')]
+
+    paginator = KeysetPaginator(PostListView.queryset, per_page)
+    deep = list(PostListView.queryset.order_by(*paginator.ordering())[deep_page:deep_page + 1])
+    if deep:
+        routes['deep pagination'] = [('/', 'cursor=' + paginator.encode_cursor('next', deep[0]))]
+
+    bounds = Post.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is not None:
+        pks = [rng.randint(bounds['low'], bounds['high']) for i in range(samples)]
+        routes['post detail'] = [(post.get_absolute_url(), '')
+                                 for post in Post.objects.filter(pk__in=pks).only('slug', 'pub_date')]
+
+    categories = list(Category.objects.exclude(slug=None)[:samples])
+    if categories:
+        routes['category'] = [(category.get_absolute_url(), '') for category in categories]
+
+    flatpages = FlatPage.objects.filter(sites=settings.SITE_ID, registration_required=False)
+    urls = list(flatpages.values_list('url', flat=True)[:samples])
+    if urls:
+        routes['flatpage'] = [(url, '') for url in urls]
+
+    return routes
+
+
+def run(driver, routes, requests, warmup=10):
+    """
+    Fetch each route's samples in turn, requests times per route, and
+    return the latency percentiles in ms and mean queries per request.
+    """
+    results = OrderedDict()
+
+    for name, samples in routes.items():
+        for path, query_string in samples[:warmup]:
+            driver.get(path, query_string)
+
+        timings = []
+        queries = 0
+
+        for i in range(requests):
+            path, query_string = samples[i % len(samples)]
+
+            with CaptureQueriesContext(connection) as captured:
+                started = time.time()
+                status = driver.get(path, query_string)
+                timings.append(time.time() - started)
+
+            if status != 200:
+                raise AssertionError('{0}?{1} returned {2}'.format(path, query_string, status))
+            queries += len(captured)
+
+        results[name] = {
+            'p50': percentile(timings, 50) * 1000,
+            'p95': percentile(timings, 95) * 1000,
+            'p99': percentile(timings, 99) * 1000,
+            'queries': float(queries) / requests,
+        }
+
+    return results
+
+
+def template_times(driver, routes, requests, warmup=10):
+    """
+    Fetch each route's samples like run() and return the mean template
+    rendering time per request in ms, as ProfilingMiddleware measures it.
+    """
+    results = OrderedDict()
+
+    for name, samples in routes.items():
+        for path, query_string in samples[:warmup]:
+            driver.get(path, query_string)
+
+        instrumentation.aggregates.reset()
+        for i in range(requests):
+            path, query_string = samples[i % len(samples)]
+            driver.get(path, query_string)
+
+        entries = instrumentation.aggregates.snapshot()['routes'].values()
+        results[name] = sum(entry['template'] for entry in entries) * 1000 / requests
+
+    return results
+
+
+def peak_rss_kb():
+    """
+    Return the peak resident set size of this process in KB.
+    """
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports KB, OS X bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def regressions(results, baseline, threshold):
+    """
+    Compare results with a baseline and describe every route whose p95
+    latency grew by more than threshold percent or that runs more queries.
+    """
+    found = []
+
+    for name, result in results.items():
+        previous = baseline.get('routes', {}).get(name)
+        if previous is None:
+            continue
+
+        if result['p95'] > previous['p95'] * (1 + threshold / 100.0):
+            found.append('{0}: p95 {1:.2f}ms, was {2:.2f}ms'.format(name, result['p95'], previous['p95']))
+        if result['queries'] > previous['queries']:
+            found.append('{0}: {1:.1f} queries per request, was {2:.1f}'.format(
+                name, result['queries'], previous['queries']))
+
+    return found
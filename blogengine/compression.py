@@ -0,0 +1,105 @@
+"""
+Content-coding for responses and static files.
+
+gzip is always available; Brotli is used when the brotli package is
+installed and the client accepts it. Each compressed page is stored in
+the page cache backend under the ETag of its uncompressed body, so a page
+is compressed once per encoding however often it is served.
+"""
+import gzip
+import re
+from io import BytesIO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from blogengine import pagecache
+
+VARIANT_PREFIX = 'blogengine:compressed:'
+
+# File name suffix of each encoding, most preferred first
+SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+ACCEPT_ENCODING = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def gzip_bytes(content):
+    buffer = BytesIO()
+    # A fixed mtime keeps the output the same for the same input
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buffer, compresslevel=9, mtime=0) as compressed:
+        compressed.write(content)
+
+    return buffer.getvalue()
+
+
+def encodings():
+    """
+    Return the encodings that can be produced, most preferred first.
+    """
+    if brotli is None:
+        return ('gzip', )
+
+    return ('br', 'gzip')
+
+
+def encode(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content)
+
+    return gzip_bytes(content)
+
+
+def negotiate(accept_encoding, available=None):
+    """
+    Return the preferred encoding of available that an Accept-Encoding
+    header accepts, or None.
+    """
+    accepted = {}
+    for name, quality in ACCEPT_ENCODING.findall(accept_encoding or ''):
+        try:
+            accepted[name.lower()] = float(quality) if quality else 1.0
+        except ValueError:
+            continue
+
+    for encoding in available or encodings():
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+
+    return None
+
+
+def variant_etag(etag, encoding):
+    """
+    Return the ETag of an encoded variant, given the quoted ETag of the
+    uncompressed response.
+    """
+    if etag.endswith('"'):
+        return '{0};{1}"'.format(etag[:-1], encoding)
+
+    return '{0};{1}'.format(etag, encoding)
+
+
+def strip_variant(etag):
+    """
+    Return the unquoted ETag of the uncompressed response an ETag from
+    variant_etag() was made from.
+    """
+    for encoding, suffix in SUFFIXES:
+        if etag.endswith(';' + encoding):
+            return etag[:-len(encoding) - 1]
+
+    return etag
+
+
+def variant_key(etag, encoding):
+    return '{0}{1}:{2}'.format(VARIANT_PREFIX, encoding, etag.strip('"'))
+
+
+def stored_variant(etag, encoding):
+    return pagecache.get_cache().get(variant_key(etag, encoding))
+
+
+def store_variant(etag, encoding, content, timeout):
+    pagecache.get_cache().set(variant_key(etag, encoding), content, timeout)
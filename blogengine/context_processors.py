@@ -0,0 +1,55 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+
+_static_version = None
+
+
+def static_version():
+    """
+    Return BLOGENGINE_STATIC_VERSION, or a digest of the static files
+    manifest when the storage writes one. Read once per process, as the
+    manifest only changes with a deploy.
+    """
+    global _static_version
+
+    if _static_version is None:
+        version = getattr(settings, 'BLOGENGINE_STATIC_VERSION', None)
+
+        if version is None:
+            manifest_name = getattr(staticfiles_storage, 'manifest_name', None)
+            version = '0'
+            if manifest_name and staticfiles_storage.exists(manifest_name):
+                with staticfiles_storage.open(manifest_name) as manifest:
+                    version = hashlib.md5(force_bytes(manifest.read())).hexdigest()[:12]
+
+        _static_version = version
+
+    return _static_version
+
+
+@receiver(setting_changed)
+def reset_static_version(sender, setting, **kwargs):
+    global _static_version
+
+    if setting in ('BLOGENGINE_STATIC_VERSION', 'STATICFILES_STORAGE', 'STATIC_ROOT', 'STATIC_URL'):
+        _static_version = None
+
+
+def layout(request):
+    """
+    Keys and timeout for the cached fragments of the base layout, and
+    whether it links the static bundles.
+    """
+    return {
+        'site_id': settings.SITE_ID,
+        'static_version': static_version(),
+        'static_bundles': getattr(settings, 'BLOGENGINE_STATIC_BUNDLES', False),
+        'current_year': timezone.template_localtime(timezone.now()).year,
+        'fragment_cache_timeout': getattr(settings, 'BLOGENGINE_FRAGMENT_CACHE_TIMEOUT', 24 * 60 * 60),
+    }
@@ -0,0 +1,111 @@
+"""
+PostgreSQL backend that keeps connections in a per-process pool.
+
+Closing a connection, as Django does at the end of a request once
+CONN_MAX_AGE has passed, hands it back to the pool instead. A connection
+that has sat idle longer than CHECK_AFTER seconds is tested with a
+"SELECT 1" before being handed out again, and dropped if it fails.
+
+Configured with a POOL entry in the database settings:
+
+    'POOL': {'MIN': 1, 'MAX': 10, 'CHECK_AFTER': 30}
+"""
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import pool
+
+from django.db.backends.postgresql_psycopg2.base import DatabaseWrapper as PostgreSQLDatabaseWrapper
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool(object):
+    def __init__(self, conn_params, min_connections, max_connections, check_after):
+        self.check_after = check_after
+        self._pool = pool.ThreadedConnectionPool(min_connections, max_connections, **conn_params)
+        self._returned = {}
+
+    def checkout(self):
+        """
+        Return a healthy connection, opening a new one if none is idle.
+        """
+        while True:
+            connection = self._pool.getconn()
+            returned = self._returned.pop(id(connection), None)
+
+            if connection.closed:
+                self._pool.putconn(connection, close=True)
+                continue
+
+            if returned is not None and time.time() - returned > self.check_after:
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    connection.rollback()
+                except psycopg2.Error:
+                    self._pool.putconn(connection, close=True)
+                    continue
+
+            return connection
+
+    def checkin(self, connection):
+        if connection.closed:
+            self._pool.putconn(connection, close=True)
+            return
+
+        try:
+            # Leave no transaction or session state behind for the next user
+            connection.rollback()
+            connection.reset()
+        except psycopg2.Error:
+            self._pool.putconn(connection, close=True)
+            return
+
+        self._returned[id(connection)] = time.time()
+        self._pool.putconn(connection)
+
+
+def get_pool(alias, conn_params, options):
+    # Keyed by pid too: connections must not be shared with forked workers
+    key = (os.getpid(), alias)
+
+    with _pools_lock:
+        connection_pool = _pools.get(key)
+        if connection_pool is None:
+            connection_pool = _pools[key] = ConnectionPool(
+                conn_params,
+                options.get('MIN', 1),
+                options.get('MAX', 10),
+                options.get('CHECK_AFTER', 30),
+            )
+
+        return connection_pool
+
+
+class DatabaseWrapper(PostgreSQLDatabaseWrapper):
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.get_connection_params(), self.settings_dict.get('POOL', {}))
+
+    def get_new_connection(self, conn_params):
+        connection = self.pool.checkout()
+
+        # As the psycopg2 backend does for a fresh connection
+        try:
+            self.isolation_level = self.settings_dict['OPTIONS']['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
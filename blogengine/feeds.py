@@ -0,0 +1,136 @@
+"""
+Atom and RSS feeds of the site's posts, and of each category.
+
+Feeds are streamed: posts are fetched in keyset batches and written out as
+they arrive, so even the full-archive feeds run in constant memory.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.feedgenerator import rfc2822_date, rfc3339_date
+from django.utils.html import escape
+from django.views.decorators.http import condition
+
+from blogengine import routers
+from blogengine.lookups import category_slugs
+from blogengine.models import Post
+from blogengine.pagination import KeysetPaginator
+
+FEED_LENGTH = 20
+BATCH_SIZE = 500
+
+CONTENT_TYPES = {
+    'atom': 'application/atom+xml; charset=utf-8',
+    'rss': 'application/rss+xml; charset=utf-8',
+}
+
+
+def feed_posts(slug=None):
+    queryset = Post.objects.filter(site_id=settings.SITE_ID)
+
+    if slug is not None:
+        category_id = category_slugs.get(slug)
+        if category_id is None:
+            raise Http404("No category found matching the query.")
+        queryset = queryset.filter(category_id=category_id)
+
+    return queryset
+
+
+def latest_pub_date(request, format, archive=None, slug=None):
+    # Needed by the ETag, the Last-Modified header and the feed itself
+    if not hasattr(request, '_feed_latest_pub_date'):
+        request._feed_latest_pub_date = (feed_posts(slug).order_by('-pub_date')
+                                                         .values_list('pub_date', flat=True)
+                                                         .first())
+
+    return request._feed_latest_pub_date
+
+
+def feed_etag(request, format, archive=None, slug=None):
+    latest = latest_pub_date(request, format, archive, slug)
+
+    return '{0}-{1}-{2}-{3}'.format(format, slug or '', 'all' if archive else FEED_LENGTH,
+                                    latest.isoformat() if latest else '')
+
+
+def iterate_posts(queryset, archive):
+    queryset = queryset.only('title', 'slug', 'pub_date', 'rendered_text')
+
+    if not archive:
+        return iter(KeysetPaginator(queryset, FEED_LENGTH).page())
+
+    return KeysetPaginator(queryset, BATCH_SIZE).iterator()
+
+
+def atom_feed(request, title, posts, updated):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<feed xmlns="http://www.w3.org/2005/Atom">'
+    yield '<title>{0}</title>'.format(escape(title))
+    yield '<link href="{0}" rel="alternate"/>'.format(escape(request.build_absolute_uri('/')))
+    yield '<link href="{0}" rel="self"/>'.format(escape(request.build_absolute_uri()))
+    yield '<id>{0}</id>'.format(escape(request.build_absolute_uri()))
+    # RFC 4287 requires both, empty feeds included; the feed's author
+    # stands for every entry
+    yield '<updated>{0}</updated>'.format(rfc3339_date(updated if updated is not None else timezone.now()))
+    yield '<author><name>{0}</name></author>'.format(escape(getattr(settings, 'BLOGENGINE_FEED_AUTHOR', title)))
+
+    for post in posts:
+        link = escape(request.build_absolute_uri(post.get_absolute_url()))
+        yield ('<entry><title>{0}</title><link href="{1}" rel="alternate"/><id>{1}</id>'
+               '<published>{2}</published><updated>{2}</updated>'
+               '<content type="html">{3}</content></entry>').format(
+            escape(post.title), link, rfc3339_date(post.pub_date), escape(post.rendered_text))
+
+    yield '</feed>\n'
+
+
+def rss_feed(request, title, posts, updated):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n'
+    yield '<rss version="2.0"><channel>'
+    yield '<title>{0}</title>'.format(escape(title))
+    yield '<link>{0}</link>'.format(escape(request.build_absolute_uri('/')))
+    yield '<description>{0}</description>'.format(escape(title))
+    if updated is not None:
+        yield '<lastBuildDate>{0}</lastBuildDate>'.format(rfc2822_date(updated))
+
+    for post in posts:
+        link = escape(request.build_absolute_uri(post.get_absolute_url()))
+        yield ('<item><title>{0}</title><link>{1}</link><guid>{1}</guid>'
+               '<pubDate>{2}</pubDate><description>{3}</description></item>').format(
+            escape(post.title), link, rfc2822_date(post.pub_date), escape(post.rendered_text))
+
+    yield '</channel></rss>\n'
+
+
+FEED_WRITERS = {
+    'atom': atom_feed,
+    'rss': rss_feed,
+}
+
+
+def stream_feed(request, format, title, queryset, archive, updated):
+    posts = iterate_posts(queryset, archive)
+    writer = FEED_WRITERS[format]
+
+    return StreamingHttpResponse(routers.iterate_on_replica(writer(request, title, posts, updated)),
+                                 content_type=CONTENT_TYPES[format])
+
+
+@routers.replica_reads
+@condition(etag_func=feed_etag, last_modified_func=latest_pub_date)
+def site_feed(request, format, archive=None):
+    updated = latest_pub_date(request, format, archive)
+
+    return stream_feed(request, format, 'My Django Blog', feed_posts(), archive, updated)
+
+
+@routers.replica_reads
+@condition(etag_func=feed_etag, last_modified_func=latest_pub_date)
+def category_feed(request, format, slug, archive=None):
+    updated = latest_pub_date(request, format, archive, slug)
+    title = 'My Django Blog: {0}'.format(slug)
+
+    return stream_feed(request, format, title, feed_posts(slug), archive, updated)
@@ -0,0 +1,96 @@
+"""
+Per-request timing of SQL, template rendering and Markdown rendering.
+
+ProfilingMiddleware starts a RequestStats for each request in a
+thread-local. Code that renders Markdown reports its time with track(),
+which does nothing outside a request. Finished requests are folded into
+per-route aggregates kept for the stats endpoint.
+"""
+import threading
+import time
+from collections import deque
+
+_local = threading.local()
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.started = time.time()
+        self.timings = {'markdown': 0.0, 'template': 0.0}
+        self.calls = {'markdown': 0, 'template': 0}
+
+
+def start():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def finish():
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    return stats
+
+
+def track(kind, seconds):
+    """
+    Add time spent on kind ('markdown', 'template') to the current request.
+    """
+    stats = getattr(_local, 'stats', None)
+
+    if stats is not None:
+        stats.timings[kind] += seconds
+        stats.calls[kind] += 1
+
+
+class RouteAggregates(object):
+    """
+    Process-wide totals per route, plus the most recent sampled profiles.
+    """
+    fields = ('total', 'db', 'template', 'markdown')
+
+    def __init__(self, profiles=20):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.profiles = deque(maxlen=profiles)
+
+    def add(self, route, timings, queries, duplicates):
+        with self._lock:
+            entry = self.routes.get(route)
+            if entry is None:
+                entry = self.routes[route] = dict(
+                    [('requests', 0), ('queries', 0), ('duplicate_queries', 0), ('max_total', 0.0)] +
+                    [(field, 0.0) for field in self.fields]
+                )
+
+            entry['requests'] += 1
+            entry['queries'] += queries
+            entry['duplicate_queries'] += duplicates
+            entry['max_total'] = max(entry['max_total'], timings['total'])
+            for field in self.fields:
+                entry[field] += timings[field]
+
+    def add_profile(self, route, path, report):
+        with self._lock:
+            self.profiles.append({'route': route, 'path': path, 'time': time.time(), 'profile': report})
+
+    def snapshot(self):
+        """
+        Return the totals with per-request means, and the recent profiles.
+        """
+        with self._lock:
+            routes = {}
+            for route, entry in self.routes.items():
+                summary = dict(entry)
+                for field in self.fields + ('queries', 'duplicate_queries'):
+                    summary['mean_' + field] = entry[field] / float(entry['requests'])
+                routes[route] = summary
+
+            return {'routes': routes, 'profiles': list(self.profiles)}
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.profiles.clear()
+
+
+aggregates = RouteAggregates()
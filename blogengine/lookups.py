@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class CategorySlugMap(object):
+    """
+    Process-local map of category slugs to ids.
+
+    The map is loaded with a single query and dropped whenever a category
+    is saved or deleted in this process. Other processes pick the change
+    up once BLOGENGINE_CATEGORY_MAP_TTL seconds have passed.
+    """
+    def __init__(self):
+        self._map = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, slug):
+        """
+        Return the id of the category with the given slug, or None.
+        """
+        return self._load().get(slug)
+
+    def invalidate(self):
+        with self._lock:
+            self._map = None
+
+    def _load(self):
+        ttl = getattr(settings, 'BLOGENGINE_CATEGORY_MAP_TTL', 60)
+        slugs = self._map
+
+        if slugs is not None and (ttl is None or time.time() - self._loaded_at < ttl):
+            return slugs
+
+        from blogengine.models import Category
+
+        with self._lock:
+            self._map = dict(Category.objects.exclude(slug=None).values_list('slug', 'id'))
+            self._loaded_at = time.time()
+
+            return self._map
+
+
+category_slugs = CategorySlugMap()
+
+
+class FlatPageTable(object):
+    """
+    Process-local table of the flatpage URLs of every site.
+
+    The catch-all flatpage URL pattern matches any path ending in a slash,
+    so every unknown URL ends up here. The table is loaded with a single
+    query. It is reloaded when the 'flatpages' page cache tag has moved on,
+    which the flatpage signals do on every change, and otherwise once
+    BLOGENGINE_FLATPAGE_TABLE_TTL seconds have passed, so other processes
+    pick changes up even when the page cache is not shared. URLs that are
+    not flatpages are remembered for BLOGENGINE_FLATPAGE_MISS_TTL seconds,
+    up to BLOGENGINE_FLATPAGE_MISSES of them, and answered without even the
+    tag lookup. Reloading forgets them.
+    """
+    def __init__(self):
+        self._pages = None
+        self._token = None
+        self._loaded_at = 0
+        self._misses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url, site_id):
+        """
+        Return the id of the flatpage at url on the given site, or None.
+        """
+        from blogengine import metrics
+
+        key = (site_id, url)
+        missed_at = self._misses.get(key)
+        if missed_at is not None and time.time() - missed_at < getattr(settings, 'BLOGENGINE_FLATPAGE_MISS_TTL', 60):
+            metrics.FLATPAGE_LOOKUPS.inc(result='negative')
+            return None
+
+        pk = self._load().get(key)
+        if pk is not None:
+            metrics.FLATPAGE_LOOKUPS.inc(result='hit')
+            return pk
+
+        metrics.FLATPAGE_LOOKUPS.inc(result='miss')
+        with self._lock:
+            self._misses.pop(key, None)
+            self._misses[key] = time.time()
+            while len(self._misses) > getattr(settings, 'BLOGENGINE_FLATPAGE_MISSES', 1000):
+                self._misses.popitem(last=False)
+
+        return None
+
+    def invalidate(self):
+        with self._lock:
+            self._pages = None
+            self._misses.clear()
+
+    def _load(self):
+        from blogengine import pagecache
+
+        ttl = getattr(settings, 'BLOGENGINE_FLATPAGE_TABLE_TTL', 60)
+        token = pagecache.tag_tokens(['flatpages'], create=True)['flatpages']
+        pages = self._pages
+
+        if pages is not None and token == self._token and (ttl is None or time.time() - self._loaded_at < ttl):
+            return pages
+
+        from django.contrib.flatpages.models import FlatPage
+
+        with self._lock:
+            # Reads the default database: a lagging replica would leave a
+            # new page out until the next change
+            rows = FlatPage.sites.through.objects.using('default').values_list('site_id', 'flatpage__url',
+                                                                               'flatpage_id')
+            self._pages = dict(((site_id, url), pk) for site_id, url, pk in rows)
+            self._token = token
+            self._loaded_at = time.time()
+            self._misses.clear()
+
+            return self._pages
+
+
+flatpage_table = FlatPageTable()
@@ -0,0 +1,59 @@
+import random
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from blogengine.benchmark import percentile, rolled_back, seed_posts, time_requests
+from blogengine.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Times the post detail page as the post table grows, with the page cache off. '
+            'Generated rows are rolled back at the end of the run.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--scales', dest='scales', default='1000,10000,100000,1000000',
+                    help='Comma separated post counts to measure at.'),
+        make_option('--requests', type='int', dest='requests', default=200,
+                    help='Number of detail pages fetched at each scale.'),
+        make_option('--seed', type='int', dest='seed', default=0,
+                    help='Seed for picking the posts to fetch.'),
+    )
+
+    def handle(self, *args, **options):
+        scales = sorted(int(scale) for scale in options['scales'].split(','))
+        rng = random.Random(options['seed'])
+
+        # Every request renders the page, so the post lookup is what is timed
+        middleware = [name for name in settings.MIDDLEWARE_CLASSES
+                      if name != 'blogengine.middleware.PageCacheMiddleware']
+
+        with override_settings(MIDDLEWARE_CLASSES=middleware), rolled_back():
+            client = Client()
+            author = User.objects.create_user('benchmark-author', 'benchmark@example.com')
+            site = Site.objects.create(name='benchmark.example.com', domain='benchmark.example.com')
+            seeded = 0
+
+            self.stdout.write('{0:>10} {1:>10} {2:>10} {3:>10}'.format('posts', 'p50 ms', 'p95 ms', 'p99 ms'))
+
+            for scale in scales:
+                seed_posts(seeded, scale, author, site)
+                seeded = scale
+
+                slugs = ['benchmark-post-{0}'.format(rng.randrange(scale)) for i in range(options['requests'])]
+                paths = [post.get_absolute_url() for post in Post.objects.filter(slug__in=slugs)]
+                rng.shuffle(paths)
+
+                timings = time_requests(client, paths)
+
+                self.stdout.write('{0:>10} {1:>10.2f} {2:>10.2f} {3:>10.2f}'.format(
+                    scale,
+                    percentile(timings, 50) * 1000,
+                    percentile(timings, 95) * 1000,
+                    percentile(timings, 99) * 1000
+                ))
@@ -0,0 +1,65 @@
+import random
+import string
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from blogengine import search
+from blogengine.benchmark import percentile, rolled_back, seed_posts
+
+
+class Command(BaseCommand):
+    help = ('Compares the full-text search index with an icontains scan on a '
+            'synthetic corpus. Generated rows are rolled back at the end of the run.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--posts', type='int', dest='posts', default=500000,
+                    help='Number of posts in the corpus.'),
+        make_option('--queries', type='int', dest='queries', default=50,
+                    help='Number of searches timed per backend.'),
+        make_option('--seed', type='int', dest='seed', default=0,
+                    help='Seed for the corpus and the queries.'),
+    )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = [''.join(rng.choice(string.ascii_lowercase) for i in range(rng.randint(4, 9)))
+                      for i in range(5000)]
+
+        def text(number):
+            return ' '.join(rng.choice(vocabulary) for i in range(60))
+
+        queries = [rng.choice(vocabulary) for i in range(options['queries'])]
+        indexed = search.get_backend()
+
+        with rolled_back():
+            author = User.objects.create_user('benchmark-author', 'benchmark@example.com')
+            site = Site.objects.create(name='benchmark.example.com', domain='benchmark.example.com')
+
+            started = time.time()
+            seed_posts(0, options['posts'], author, site, text=text)
+            self.stdout.write('Created {0} posts in {1:.1f}s'.format(options['posts'], time.time() - started))
+
+            started = time.time()
+            indexed.reindex()
+            self.stdout.write('Indexed them in {0:.1f}s'.format(time.time() - started))
+
+            self.stdout.write('{0:>24} {1:>10} {2:>10} {3:>10}'.format('backend', 'p50 ms', 'p95 ms', 'p99 ms'))
+
+            for backend in (indexed, search.SearchBackend(connection.alias)):
+                timings = []
+                for query in queries:
+                    started = time.time()
+                    backend.search(query, 0, 10)
+                    timings.append(time.time() - started)
+
+                self.stdout.write('{0:>24} {1:>10.2f} {2:>10.2f} {3:>10.2f}'.format(
+                    backend.__class__.__name__,
+                    percentile(timings, 50) * 1000,
+                    percentile(timings, 95) * 1000,
+                    percentile(timings, 99) * 1000
+                ))
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from blogengine import benchmark
+
+
+def uncached_loaders(loaders):
+    """
+    Return the template loaders with any cached loader replaced by the
+    loaders it wraps.
+    """
+    unwrapped = []
+    for loader in loaders:
+        if isinstance(loader, (list, tuple)) and loader[0] == 'django.template.loaders.cached.Loader':
+            unwrapped.extend(loader[1])
+        else:
+            unwrapped.append(loader)
+
+    return tuple(unwrapped)
+
+
+class Command(BaseCommand):
+    help = ('Measures template rendering time per route with templates compiled on every request '
+            'and no layout fragment caching, then with the current settings.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', type='int', dest='requests', default=200,
+                    help='Requests per route.'),
+        make_option('--samples', type='int', dest='samples', default=50,
+                    help='Distinct URLs per route.'),
+        make_option('--seed', type='int', dest='seed', default=0),
+    )
+
+    def handle(self, *args, **options):
+        middleware = [name for name in settings.MIDDLEWARE_CLASSES
+                      if name != 'blogengine.middleware.PageCacheMiddleware']
+        if 'blogengine.middleware.ProfilingMiddleware' not in middleware:
+            middleware.insert(0, 'blogengine.middleware.ProfilingMiddleware')
+
+        scenarios = OrderedDict([
+            ('before', {
+                'TEMPLATE_LOADERS': uncached_loaders(settings.TEMPLATE_LOADERS),
+                'BLOGENGINE_FRAGMENT_CACHE_TIMEOUT': 0,
+            }),
+            ('after', {}),
+        ])
+
+        results = OrderedDict()
+        for name, overrides in scenarios.items():
+            with override_settings(MIDDLEWARE_CLASSES=middleware, BLOGENGINE_PROFILING=True,
+                                   BLOGENGINE_PROFILE_SAMPLE_RATE=0.0, **overrides):
+                driver = benchmark.ClientDriver()
+                routes = benchmark.route_samples(options['samples'], seed=options['seed'])
+                results[name] = benchmark.template_times(driver, routes, options['requests'])
+
+        self.stdout.write('{0:>18} {1:>11} {2:>11} {3:>9}'.format('route', 'before ms', 'after ms', 'change'))
+        for route, before in results['before'].items():
+            after = results['after'][route]
+            change = (after - before) / before * 100 if before else 0.0
+            self.stdout.write('{0:>18} {1:>11.3f} {2:>11.3f} {3:>8.1f}%'.format(route, before, after, change))
@@ -0,0 +1,64 @@
+import json
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from blogengine import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the public routes against the current database (see seed_blog), '
+            'reporting latency percentiles, queries per request and peak RSS.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', type='int', dest='requests', default=200,
+                    help='Requests per route.'),
+        make_option('--samples', type='int', dest='samples', default=50,
+                    help='Distinct URLs per route.'),
+        make_option('--deep-page', type='int', dest='deep_page', default=1000,
+                    help='Number of posts before the deep pagination page.'),
+        make_option('--wsgi', action='store_true', dest='wsgi', default=False,
+                    help='Call the WSGI handler directly instead of the test client.'),
+        make_option('--page-cache', action='store_true', dest='page_cache', default=False,
+                    help='Keep the page cache on; by default every request is rendered.'),
+        make_option('--seed', type='int', dest='seed', default=0),
+        make_option('--save-baseline', dest='save_baseline', default=None,
+                    help='Write the results to this file.'),
+        make_option('--baseline', dest='baseline', default=None,
+                    help='Compare the results with this file and fail on regressions.'),
+        make_option('--threshold', type='float', dest='threshold', default=10.0,
+                    help='Allowed p95 growth over the baseline, in percent.'),
+    )
+
+    def handle(self, *args, **options):
+        middleware = settings.MIDDLEWARE_CLASSES
+        if not options['page_cache']:
+            middleware = [name for name in middleware if name != 'blogengine.middleware.PageCacheMiddleware']
+
+        with override_settings(MIDDLEWARE_CLASSES=middleware):
+            driver = benchmark.WSGIDriver() if options['wsgi'] else benchmark.ClientDriver()
+            routes = benchmark.route_samples(options['samples'], options['deep_page'], seed=options['seed'])
+            results = benchmark.run(driver, routes, options['requests'])
+
+        report = {'routes': results, 'peak_rss_kb': benchmark.peak_rss_kb()}
+
+        self.stdout.write('{0:>18} {1:>9} {2:>9} {3:>9} {4:>9}'.format('route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for name, result in results.items():
+            self.stdout.write('{0:>18} {1[p50]:>9.2f} {1[p95]:>9.2f} {1[p99]:>9.2f} {1[queries]:>9.1f}'.format(
+                name, result))
+        self.stdout.write('Peak RSS: {0} KB'.format(report['peak_rss_kb']))
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline:
+                json.dump(report, baseline, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                found = benchmark.regressions(results, json.load(baseline), options['threshold'])
+
+            if found:
+                raise CommandError('Regressions against {0}:\n{1}'.format(options['baseline'], '\n'.join(found)))
+
+            self.stdout.write('No regressions against {0}'.format(options['baseline']))
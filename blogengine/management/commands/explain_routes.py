@@ -0,0 +1,119 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+from django.utils import timezone
+
+from blogengine import search
+from blogengine.models import Category, Post
+from blogengine.pagination import KeysetPaginator
+from blogengine.views import (ArchiveView, CategoryListView, PostDetailView, PostListView, SearchView, month_range,
+                              year_range)
+
+PAGE_SIZE = 5
+
+# Routes whose sort is by relevance, which no index can give, so only
+# their scans are flagged
+RANKED_ROUTES = ('search', )
+
+
+class Command(BaseCommand):
+    help = ('Runs EXPLAIN on the queries behind each public route and flags '
+            'sequential scans and sorts that do not use an index.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--database', dest='database', default='default',
+                    help='Database alias to explain the queries against.'),
+    )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        flagged = []
+
+        for name, query in self.route_queries(options['database']):
+            if isinstance(query, tuple):
+                sql, params = query
+            else:
+                sql, params = query.using(options['database']).query.sql_with_params()
+            plan = self.explain(connection, sql, params)
+            problems = [line for line in plan if self.is_scan(connection, line, sorts=name not in RANKED_ROUTES)]
+
+            self.stdout.write('{0}{1}'.format(name, ' [SCAN]' if problems else ''))
+            for line in plan:
+                self.stdout.write('    {0}'.format(line))
+
+            if problems:
+                flagged.append(name)
+
+        if flagged:
+            raise CommandError('Sequential scans in: {0}'.format(', '.join(flagged)))
+
+    def route_queries(self, using):
+        """
+        Yield (name, queryset or (sql, params)) for the queries each route
+        runs, using the newest post and first category as sample arguments.
+        The category slug map is in memory, so it has no query here.
+        """
+        post = Post.objects.using(using).only('pk', 'pub_date', 'slug', 'title').first()
+        pub_date = post.pub_date if post else timezone.now()
+        slug = post.slug if post else 'example'
+        pk = post.pk if post else 1
+        category_slug = Category.objects.using(using).exclude(slug=None).values_list('slug', flat=True).first()
+
+        index = self.view(PostListView)
+        paginator = KeysetPaginator(index.get_queryset(), PAGE_SIZE)
+        yield 'index', paginator.page_queryset()
+        yield 'index (deep page)', paginator.page_queryset('next', [pub_date, pk])
+
+        detail = self.view(PostDetailView)
+        start, end = month_range(pub_date.year, pub_date.month)
+        yield 'post detail', detail.get_queryset().filter(slug=slug, pub_date__gte=start, pub_date__lt=end)
+
+        if category_slug is not None:
+            category = self.view(CategoryListView, slug=category_slug)
+            paginator = KeysetPaginator(category.get_queryset(), PAGE_SIZE)
+            yield 'category', paginator.page_queryset()
+            yield 'category (deep page)', paginator.page_queryset('next', [pub_date, pk])
+
+        for name, (start, end) in (('archive (year)', year_range(pub_date.year)),
+                                   ('archive (month)', month_range(pub_date.year, pub_date.month))):
+            archive = self.view(ArchiveView)
+            archive.start, archive.end = start, end
+            yield name, KeysetPaginator(archive.get_queryset(), PAGE_SIZE).page_queryset()
+
+        terms = search.search_terms(post.title if post else '') or ['example']
+        statement = search.get_backend(using).search_statement(terms[0], 0, SearchView.paginate_by + 1)
+        if statement is not None:
+            yield 'search', statement
+        yield 'search (posts)', Post.objects.for_listing().filter(pk__in=[pk])
+
+    def view(self, view_class, **kwargs):
+        view = view_class()
+        view.request = RequestFactory().get('/')
+        view.args = ()
+        view.kwargs = kwargs
+
+        return view
+
+    def explain(self, connection, sql, params):
+        cursor = connection.cursor()
+
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+        cursor.execute('EXPLAIN ' + sql, params)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+    def is_scan(self, connection, line, sorts=True):
+        if connection.vendor == 'sqlite':
+            # Full-text tables report their index as VIRTUAL TABLE INDEX
+            scan = line.startswith('SCAN') and 'USING' not in line and 'VIRTUAL TABLE INDEX' not in line
+            return scan or (sorts and 'TEMP B-TREE' in line)
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan' in line
+        if connection.vendor == 'mysql':
+            return ' ALL ' in line
+
+        return False
@@ -0,0 +1,53 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blogengine import transfer
+from blogengine.models import Post
+from blogengine.pagination import KeysetPaginator
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = 'Streams every post out as JSON Lines or CSV; the file defaults to stdout.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='jsonl', choices=transfer.FORMATS,
+                    help='jsonl or csv.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=1000,
+                    help='Number of posts fetched per query.'),
+    )
+
+    def handle(self, path='-', *args, **options):
+        if args:
+            raise CommandError('Usage is export_posts {0}'.format(self.args))
+
+        posts = (Post.objects.select_related('category', 'author', 'site')
+                             .only('title', 'slug', 'pub_date', 'text',
+                                   'category__slug', 'category__name', 'author__username', 'site__domain'))
+
+        rows = (self.row(post) for post in KeysetPaginator(posts, options['batch_size'], ordering=['pk']).iterator())
+
+        started = time.time()
+        stream = transfer.open_file(path, 'w')
+        try:
+            count = transfer.write_rows(stream, options['format'], rows)
+        finally:
+            if path != '-':
+                stream.close()
+
+        elapsed = max(time.time() - started, 1e-6)
+        self.stderr.write('Exported {0} posts in {1:.1f}s ({2:.0f} rows/s)'.format(count, elapsed, count / elapsed))
+
+    def row(self, post):
+        return {
+            'title': post.title,
+            'slug': post.slug,
+            'pub_date': post.pub_date.isoformat(),
+            'text': post.text,
+            'category': post.category.slug if post.category else None,
+            'category_name': post.category.name if post.category else None,
+            'author': post.author.username,
+            'site': post.site.domain,
+        }
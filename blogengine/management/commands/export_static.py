@@ -0,0 +1,187 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils.encoding import force_bytes
+
+from blogengine.models import Category, Post
+
+MANIFEST_NAME = '.export-manifest.json'
+
+_client = None
+
+
+def fingerprint(*values):
+    return hashlib.sha1(force_bytes(repr(values))).hexdigest()
+
+
+def output_path(output_dir, url):
+    parts = [part for part in url.split('/') if part]
+
+    return os.path.join(output_dir, *(parts + ['index.html']))
+
+
+def export_settings():
+    """
+    Render numbered pages, which map onto files, and keep the exported
+    pages out of the live page cache.
+    """
+    return override_settings(
+        BLOGENGINE_PAGINATION_MODE='offset',
+        MIDDLEWARE_CLASSES=[middleware for middleware in settings.MIDDLEWARE_CLASSES
+                            if middleware != 'blogengine.middleware.PageCacheMiddleware']
+    )
+
+
+def init_worker():
+    global _client
+
+    # Connections inherited from the parent must not be shared
+    for connection in connections.all():
+        connection.close()
+
+    export_settings().enable()
+    _client = Client()
+
+
+def render_page(job):
+    url, path = job
+    response = _client.get(url)
+
+    if response.status_code != 200:
+        return url, response.status_code
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    with open(path, 'wb') as page:
+        page.write(response.content)
+
+    return url, response.status_code
+
+
+class Command(BaseCommand):
+    help = ('Renders every index, post, category and flatpage into static files. '
+            'Only pages whose rows changed since the last export are re-rendered; '
+            'use --force after changing templates.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--output', dest='output', default=os.path.join(settings.BASE_DIR, 'export'),
+                    help='Directory to write the pages to.'),
+        make_option('--processes', type='int', dest='processes', default=multiprocessing.cpu_count(),
+                    help='Number of rendering processes.'),
+        make_option('--per-page', type='int', dest='per_page', default=5,
+                    help='Posts per index and category page, as in blogengine.urls.'),
+        make_option('--force', action='store_true', dest='force', default=False,
+                    help='Re-render every page.'),
+    )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        manifest_path = os.path.join(output, MANIFEST_NAME)
+
+        previous = {}
+        if os.path.exists(manifest_path) and not options['force']:
+            with open(manifest_path) as manifest:
+                previous = json.load(manifest)
+
+        pages = self.collect_pages(options['per_page'])
+        jobs = [(url, output_path(output, url)) for url, digest in pages.items()
+                if previous.get(url) != digest or not os.path.exists(output_path(output, url))]
+
+        for url in set(previous) - set(pages):
+            path = output_path(output, url)
+            if os.path.exists(path):
+                os.remove(path)
+
+        self.stdout.write('{0} page(s), {1} to render'.format(len(pages), len(jobs)))
+
+        failed = []
+        for url, status in self.render(jobs, options['processes']):
+            if status != 200:
+                failed.append(url)
+                self.stderr.write('{0} returned {1}'.format(url, status))
+
+        manifest = dict((url, digest) for url, digest in pages.items() if url not in failed)
+
+        if not os.path.isdir(output):
+            os.makedirs(output)
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+
+        if failed:
+            raise CommandError('{0} page(s) failed to render'.format(len(failed)))
+
+    def render(self, jobs, processes):
+        global _client
+
+        if processes <= 1:
+            with export_settings():
+                _client = Client()
+                for job in jobs:
+                    yield render_page(job)
+            return
+
+        for connection in connections.all():
+            connection.close()
+
+        pool = multiprocessing.Pool(processes, initializer=init_worker)
+        try:
+            for result in pool.imap_unordered(render_page, jobs, chunksize=16):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    def collect_pages(self, per_page):
+        """
+        Return an ordered dict of every URL to export and a fingerprint of
+        the rows it shows.
+        """
+        pages = OrderedDict()
+        categories = dict((pk, (slug, name)) for pk, slug, name
+                          in Category.objects.exclude(slug=None).values_list('pk', 'slug', 'name'))
+
+        index = []
+        by_category = OrderedDict((pk, []) for pk in categories)
+
+        rows = (Post.objects.order_by(*Post._meta.ordering)
+                            .values_list('slug', 'pub_date', 'title', 'text_hash', 'category_id')
+                            .iterator())
+
+        for slug, pub_date, title, text_hash, category_id in rows:
+            category = categories.get(category_id)
+            digest = fingerprint(slug, pub_date.isoformat(), title, text_hash, category)
+
+            pages[Post(slug=slug, pub_date=pub_date).get_absolute_url()] = digest
+            index.append(digest)
+            if category_id in by_category:
+                by_category[category_id].append(digest)
+
+        self.add_list_pages(pages, '/', index, per_page)
+        for pk, digests in by_category.items():
+            self.add_list_pages(pages, '/category/{0}/'.format(categories[pk][0]), digests, per_page)
+
+        flatpages = FlatPage.objects.filter(sites=settings.SITE_ID, registration_required=False)
+        for url, title, content, template_name in flatpages.values_list('url', 'title', 'content', 'template_name'):
+            pages[url] = fingerprint(title, content, template_name)
+
+        return pages
+
+    def add_list_pages(self, pages, base_url, digests, per_page):
+        page_count = max((len(digests) + per_page - 1) // per_page, 1)
+
+        for number in range(1, page_count + 1):
+            url = base_url if number == 1 else '{0}{1}/'.format(base_url, number)
+            shown = digests[(number - 1) * per_page:number * per_page]
+            pages[url] = fingerprint(shown, number > 1, number < page_count)
@@ -0,0 +1,143 @@
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blogengine import transfer
+from blogengine.models import Category, Post
+from blogengine.rendering import render_markdown, source_hash
+from blogengine.signals import bulk_posts_created
+from blogengine.slugs import SlugAllocator
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = ('Imports posts from JSON Lines or CSV, as written by export_posts; '
+            'the file defaults to stdin. Authors and sites must exist; '
+            'missing categories are created.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='jsonl', choices=transfer.FORMATS,
+                    help='jsonl or csv.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=1000,
+                    help='Number of posts written per bulk insert and transaction.'),
+        make_option('--defer-rendering', action='store_true', dest='defer_rendering', default=False,
+                    help="Skip rendering the Markdown; run render_markdown afterwards."),
+    )
+
+    def handle(self, path='-', *args, **options):
+        if args:
+            raise CommandError('Usage is import_posts {0}'.format(self.args))
+
+        self.authors = dict(User.objects.values_list('username', 'pk'))
+        self.sites = dict(Site.objects.values_list('domain', 'pk'))
+        self.categories = dict(Category.objects.exclude(slug=None).values_list('slug', 'pk'))
+        self.slug_allocator = SlugAllocator(Post)
+        self.defer_rendering = options['defer_rendering']
+
+        last_pk = Post.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        touched_categories = set()
+        batch = []
+        count = 0
+        started = time.time()
+
+        stream = transfer.open_file(path, 'r')
+        try:
+            for line, row in enumerate(transfer.read_rows(stream, options['format']), 1):
+                try:
+                    batch.append(self.build_post(row))
+                except ValueError as e:
+                    raise CommandError('Row {0}: {1}'.format(line, e))
+
+                if len(batch) >= options['batch_size']:
+                    count += self.write(batch, touched_categories)
+                    batch = []
+                    self.report(count, started)
+
+            count += self.write(batch, touched_categories)
+        finally:
+            if path != '-':
+                stream.close()
+
+        bulk_posts_created(last_pk, touched_categories)
+        self.report(count, started)
+
+    def build_post(self, row):
+        for field in ('title', 'pub_date', 'author', 'site'):
+            if row[field] is None:
+                raise ValueError('{0} is required'.format(field))
+
+        if row['author'] not in self.authors:
+            raise ValueError('unknown author {0}'.format(row['author']))
+        if row['site'] not in self.sites:
+            raise ValueError('unknown site {0}'.format(row['site']))
+
+        pub_date = parse_datetime(row['pub_date'])
+        if pub_date is None:
+            raise ValueError('invalid pub_date {0}'.format(row['pub_date']))
+        if timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date, timezone.get_default_timezone())
+
+        text = row['text'] or ''
+        post = Post(
+            title=row['title'],
+            slug=row['slug'] or row['title'],
+            pub_date=pub_date,
+            text=text,
+            author_id=self.authors[row['author']],
+            site_id=self.sites[row['site']],
+            category_id=self.category_id(row['category'], row['category_name'])
+        )
+
+        if not self.defer_rendering:
+            post.rendered_text = render_markdown(text)
+            post.text_hash = source_hash(text)
+
+        return post
+
+    def category_id(self, slug, name):
+        if slug is None:
+            return None
+
+        if slug not in self.categories:
+            category = Category(slug=slug, name=name or slug, description='')
+            category.save()
+            self.categories[slug] = category.pk
+
+        return self.categories[slug]
+
+    def write(self, batch, touched_categories, attempts=5):
+        """
+        Give the batch unique slugs with one lookup and insert it, trying
+        again if a concurrent writer took one of the slugs meanwhile.
+        """
+        if not batch:
+            return 0
+
+        # build_post left the value to slugify in the slug field
+        values = [post.slug for post in batch]
+
+        for attempt in range(attempts):
+            for post, slug in zip(batch, self.slug_allocator.allocate(values)):
+                post.slug = slug
+
+            try:
+                with transaction.atomic():
+                    Post.objects.bulk_create(batch)
+                break
+            except IntegrityError:
+                if attempt == attempts - 1:
+                    raise
+
+        touched_categories.update(post.category_id for post in batch if post.category_id is not None)
+
+        return len(batch)
+
+    def report(self, count, started):
+        elapsed = max(time.time() - started, 1e-6)
+        self.stderr.write('Imported {0} posts in {1:.1f}s ({2:.0f} rows/s)'.format(count, elapsed, count / elapsed))
@@ -0,0 +1,19 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from blogengine import aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recounts the posts per month and per category shown in the navigation.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--database', dest='database', default='default',
+                    help='Database alias whose counts to rebuild.'),
+    )
+
+    def handle(self, *args, **options):
+        months, categories = aggregates.rebuild(options['database'])
+
+        self.stdout.write('Counted posts in {0} months and {1} categories'.format(len(months), len(categories)))
@@ -0,0 +1,23 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blogengine import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of posts.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--database', dest='database', default='default',
+                    help='Database alias whose index to rebuild.'),
+    )
+
+    def handle(self, *args, **options):
+        backend = search.get_backend(options['database'])
+
+        with transaction.atomic(using=options['database']):
+            backend.reindex()
+
+        self.stdout.write('Rebuilt the index with {0}'.format(backend.__class__.__name__))
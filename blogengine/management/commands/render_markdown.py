@@ -0,0 +1,49 @@
+from optparse import make_option
+
+from django.contrib.flatpages.models import FlatPage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blogengine.models import FlatPageRendering, Post
+
+
+class Command(BaseCommand):
+    help = 'Re-renders the stored Markdown HTML of every post and flatpage.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--force', action='store_true', dest='force', default=False,
+                    help='Re-render everything, even if the source hash is unchanged.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+                    help='Number of posts to update per transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        batch_size = options['batch_size']
+
+        rendered = 0
+        last_pk = 0
+
+        while True:
+            batch = list(Post.objects.filter(pk__gt=last_pk)
+                                     .order_by('pk')
+                                     .only('pk', 'text', 'text_hash')[:batch_size])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                for post in batch:
+                    if post.render_text(force=force):
+                        Post.objects.filter(pk=post.pk).update(rendered_text=post.rendered_text,
+                                                               text_hash=post.text_hash)
+                        rendered += 1
+
+            last_pk = batch[-1].pk
+
+        self.stdout.write('Rendered {0} post(s)'.format(rendered))
+
+        with transaction.atomic():
+            for flatpage in FlatPage.objects.all().iterator():
+                FlatPageRendering.refresh(flatpage, force=force)
+
+        self.stdout.write('Refreshed {0} flatpage(s)'.format(FlatPage.objects.count()))
@@ -0,0 +1,53 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from blogengine.synthetic import NEWEST, SCALES, Generator
+
+
+class Command(BaseCommand):
+    help = ('Fills the database with seeded synthetic posts, categories, users, '
+            'sites and flatpages for benchmarking.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--scale', dest='scale', default=None, choices=sorted(SCALES),
+                    help='small (1k posts), medium (100k) or large (1M).'),
+        make_option('--posts', type='int', dest='posts', default=None,
+                    help='Number of posts, instead of --scale.'),
+        make_option('--categories', type='int', dest='categories', default=20),
+        make_option('--authors', type='int', dest='authors', default=10),
+        make_option('--sites', type='int', dest='sites', default=1),
+        make_option('--flatpages', type='int', dest='flatpages', default=5),
+        make_option('--seed', type='int', dest='seed', default=0),
+        make_option('--newest', dest='newest', default=None,
+                    help='Publication date (YYYY-MM-DD) of the newest post. Defaults to {0}.'.format(
+                        NEWEST.date().isoformat())),
+        make_option('--batch-size', type='int', dest='batch_size', default=1000),
+    )
+
+    def handle(self, *args, **options):
+        if options['posts'] is None and options['scale'] is None:
+            raise CommandError('Give either --scale or --posts.')
+
+        posts = options['posts'] if options['posts'] is not None else SCALES[options['scale']]
+
+        newest = NEWEST
+        if options['newest'] is not None:
+            try:
+                newest = datetime.datetime.strptime(options['newest'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            except ValueError:
+                raise CommandError('--newest must be a date as YYYY-MM-DD.')
+
+        Generator(options['seed'], newest=newest).generate(
+            posts,
+            categories=options['categories'],
+            authors=options['authors'],
+            sites=options['sites'],
+            flatpages=options['flatpages'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout if int(options['verbosity']) > 1 else None
+        )
+
+        self.stdout.write('Created {0} posts'.format(posts))
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Starts the WSGI application in a fresh process and reports the time spent '
+            'in each start-up step and in the slowest imports.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--no-warmup', action='store_false', dest='warmup', default=True,
+                    help='Leave out the warm-up steps, as a worker started without BLOGENGINE_WARMUP.'),
+    )
+
+    def handle(self, *args, **options):
+        module = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+
+        env = dict(os.environ, BLOGENGINE_STARTUP_REPORT='1')
+        env.pop('BLOGENGINE_WARMUP', None)
+        if options['warmup']:
+            env['BLOGENGINE_WARMUP'] = '1'
+
+        process = subprocess.Popen([sys.executable, '-c', 'import {0}'.format(module)], env=env,
+                                   cwd=settings.BASE_DIR,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        out, err = process.communicate()
+
+        if process.returncode:
+            raise CommandError('Starting {0} failed:\n{1}'.format(module, err))
+
+        self.stdout.write(err)
@@ -0,0 +1,25 @@
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from blogengine import routers
+
+
+class Command(BaseCommand):
+    help = 'Copies the default SQLite database over the replica, for trying out replica reads locally.'
+
+    def handle(self, *args, **options):
+        alias = routers.replica_alias()
+        if alias is None:
+            raise CommandError('No replica is configured; set DATABASE_REPLICA_URL.')
+
+        default, replica = connections['default'], connections[alias]
+        if default.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Both databases must be SQLite files.')
+
+        default.close()
+        replica.close()
+        shutil.copyfile(default.settings_dict['NAME'], replica.settings_dict['NAME'])
+
+        self.stdout.write('Copied {0} to {1}'.format(default.settings_dict['NAME'], replica.settings_dict['NAME']))
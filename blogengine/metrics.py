@@ -0,0 +1,417 @@
+"""
+Prometheus metrics shared between worker processes.
+
+Every process writes its samples to its own mmapped files in
+BLOGENGINE_METRICS_DIR: counters and histograms to counter-<pid>.db and
+gauges to gauge-<pid>.db. The /metrics view reads every file in the
+directory and adds them up, so any worker can answer for all of them.
+Counters from workers that have exited are kept; gauges are only read
+from workers that are still running. Empty the directory before starting
+gunicorn.
+
+Without BLOGENGINE_METRICS_DIR the values are kept in memory, and only
+cover the current process. Set it whenever there is more than one worker.
+"""
+from __future__ import unicode_literals
+
+import errno
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.test.signals import setting_changed
+from django.utils.crypto import constant_time_compare
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HEADER = struct.Struct(str('<q'))
+LENGTH = struct.Struct(str('<i'))
+VALUE = struct.Struct(str('<d'))
+
+
+def _padded(length):
+    # Keeps every value 8-byte aligned
+    return length + (-(LENGTH.size + length) % 8)
+
+
+def read_values(data):
+    """
+    Yield (key, value) from the bytes of a value file.
+    """
+    if len(data) < HEADER.size:
+        return
+
+    used = HEADER.unpack_from(data, 0)[0]
+    position = HEADER.size
+
+    while position < used:
+        length = LENGTH.unpack_from(data, position)[0]
+        key_start = position + LENGTH.size
+        key = data[key_start:key_start + length].decode('utf-8')
+        position = key_start + _padded(length)
+        yield key, VALUE.unpack_from(data, position)[0], position
+        position += VALUE.size
+
+
+class ValueFile(object):
+    """
+    A growable mmapped file of (key, float) records, written by one process.
+
+    New records are written before the header's used length is moved past
+    them, so readers never see a half-written record.
+    """
+    initial_size = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self.initial_size:
+            self._file.truncate(self.initial_size)
+            size = self.initial_size
+
+        self._capacity = size
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._used = HEADER.unpack_from(self._mmap, 0)[0]
+        if not self._used:
+            self._used = HEADER.size
+            HEADER.pack_into(self._mmap, 0, self._used)
+
+        self._positions = dict((key, position) for key, value, position in read_values(self._mmap))
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+
+        encoded = key.encode('utf-8')
+        padded = _padded(len(encoded))
+        record = LENGTH.size + padded + VALUE.size
+
+        while self._used + record > self._capacity:
+            self._grow()
+
+        LENGTH.pack_into(self._mmap, self._used, len(encoded))
+        self._mmap[self._used + LENGTH.size:self._used + LENGTH.size + len(encoded)] = encoded
+        position = self._used + LENGTH.size + padded
+        VALUE.pack_into(self._mmap, position, 0.0)
+
+        self._used += record
+        HEADER.pack_into(self._mmap, 0, self._used)
+        self._positions[key] = position
+
+        return position
+
+    def _grow(self):
+        self._mmap.close()
+        self._capacity *= 2
+        self._file.truncate(self._capacity)
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._position(key)
+            VALUE.pack_into(self._mmap, position, VALUE.unpack_from(self._mmap, position)[0] + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            VALUE.pack_into(self._mmap, self._position(key), value)
+
+
+class MemoryValues(object):
+    """
+    The (key, float) records of this process alone, for when there is no
+    BLOGENGINE_METRICS_DIR to share them through.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+_lock = threading.Lock()
+_files = {}
+_pid = None
+
+
+def metrics_dir():
+    return getattr(settings, 'BLOGENGINE_METRICS_DIR', None) or None
+
+
+def value_file(kind):
+    """
+    Return this process's store for kind ('counter' or 'gauge').
+    """
+    global _pid
+
+    with _lock:
+        pid = os.getpid()
+        if pid != _pid:
+            # First use, or a worker forked from a process that had its own
+            # files open. Those belong to the parent and are left alone.
+            _files.clear()
+            _pid = pid
+
+        values = _files.get(kind)
+        if values is None:
+            path = metrics_dir()
+            if path is None:
+                values = _files[kind] = MemoryValues()
+            else:
+                values = _files[kind] = ValueFile(os.path.join(path, '{0}-{1}.db'.format(kind, pid)))
+
+        return values
+
+
+@receiver(setting_changed)
+def reset_value_files(sender, setting, **kwargs):
+    global _pid
+
+    if setting == 'BLOGENGINE_METRICS_DIR':
+        with _lock:
+            _files.clear()
+            _pid = None
+
+
+registry = {}
+
+
+class Metric(object):
+    kind = None
+    file_kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry[name] = self
+
+    def key(self, suffix, labels, extra=()):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{0} takes the labels {1}'.format(self.name, ', '.join(self.labelnames)))
+
+        return json.dumps([self.name, suffix, sorted((name, '%s' % value) for name, value in labels.items()) +
+                           list(extra)])
+
+    def samples(self, values):
+        """
+        Yield (name, labels, value) for the summed values of this metric.
+        """
+        for (suffix, labels), value in sorted(values.items()):
+            yield self.name + suffix, labels, value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        value_file(self.file_kind).add(self.key('_total', labels), amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+    file_kind = 'gauge'
+
+    def set(self, value, **labels):
+        value_file(self.file_kind).set(self.key('', labels), value)
+
+    def inc(self, amount=1, **labels):
+        value_file(self.file_kind).add(self.key('', labels), amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    buckets = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        values = value_file(self.file_kind)
+
+        # Buckets are stored singly and made cumulative when exposed
+        for bound in self.buckets:
+            if value <= bound:
+                values.add(self.key('_bucket', labels, [('le', format_value(bound))]), 1)
+                break
+
+        values.add(self.key('_sum', labels), value)
+        values.add(self.key('_count', labels), 1)
+
+    def samples(self, values):
+        series = {}
+        for (suffix, labels), value in values.items():
+            if suffix == '_bucket':
+                le = labels[-1][1]
+                series.setdefault(labels[:-1], {})[le] = value
+            else:
+                series.setdefault(labels, {})[suffix] = value
+
+        for labels, entry in sorted(series.items()):
+            total = 0
+            for bound in self.buckets:
+                total += entry.get(format_value(bound), 0)
+                yield self.name + '_bucket', labels + (('le', format_value(bound)), ), total
+            yield self.name + '_bucket', labels + (('le', '+Inf'), ), entry.get('_count', 0)
+            yield self.name + '_sum', labels, entry.get('_sum', 0)
+            yield self.name + '_count', labels, entry.get('_count', 0)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    if value == int(value):
+        return '{0}.0'.format(int(value))
+
+    return repr(float(value))
+
+
+def escape_label(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+
+    return True
+
+
+FILE_NAME = re.compile(r'^(counter|gauge)-(\d+)\.db$')
+
+
+def file_records(path):
+    """
+    Yield (key, value) from the files of every process in path.
+    """
+    for name in sorted(os.listdir(path)):
+        match = FILE_NAME.match(name)
+        if match is None:
+            continue
+
+        kind, pid = match.group(1), int(match.group(2))
+        if kind == 'gauge' and not process_running(pid):
+            continue
+
+        try:
+            with open(os.path.join(path, name), 'rb') as values:
+                data = values.read()
+        except IOError:
+            continue
+
+        for key, value, position in read_values(data):
+            yield key, value
+
+
+def memory_records():
+    """
+    Yield (key, value) from this process's in-memory stores.
+    """
+    with _lock:
+        stores = list(_files.values()) if _pid == os.getpid() else []
+
+    for values in stores:
+        for key, value in values.items():
+            yield key, value
+
+
+def collect(path=None):
+    """
+    Sum the values in every process's files, by metric. Without a metrics
+    directory, only this process's values are read.
+    """
+    path = path or metrics_dir()
+    summed = {}
+
+    for key, value in (file_records(path) if path else memory_records()):
+        metric, suffix, labels = json.loads(key)
+        series = summed.setdefault(metric, {})
+        series_key = (suffix, tuple(tuple(label) for label in labels))
+        series[series_key] = series.get(series_key, 0) + value
+
+    return summed
+
+
+def exposition(path=None):
+    """
+    Return every registered metric in the Prometheus text format.
+    """
+    summed = collect(path)
+    lines = []
+
+    for name in sorted(registry):
+        metric = registry[name]
+        lines.append('# HELP {0} {1}'.format(name, metric.documentation.replace('\\', r'\\').replace('\n', r'\n')))
+        lines.append('# TYPE {0} {1}'.format(name, metric.kind))
+
+        for sample, labels, value in metric.samples(summed.get(name, {})):
+            if labels:
+                sample += '{' + ','.join('{0}="{1}"'.format(label, escape_label(label_value))
+                                         for label, label_value in labels) + '}'
+            lines.append('{0} {1}'.format(sample, format_value(value)))
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Serve the metrics of every worker. Reads files only, never the database.
+    """
+    token = getattr(settings, 'BLOGENGINE_METRICS_TOKEN', None)
+    if token and not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token):
+        return HttpResponseForbidden()
+
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
+
+
+REQUEST_LATENCY = Histogram('blogengine_request_duration_seconds',
+                            'Time to produce a response, by URL name.', ['route'])
+RESPONSES = Counter('blogengine_responses', 'Responses by URL name and status code.', ['route', 'status'])
+DB_QUERIES = Counter('blogengine_db_queries', 'SQL queries run, by URL name.', ['route'])
+DB_DUPLICATE_QUERIES = Counter('blogengine_db_duplicate_queries',
+                               'SQL queries repeated within a request, by URL name.', ['route'])
+MARKDOWN_RENDERS = Counter('blogengine_markdown_renders', 'Markdown texts rendered to HTML.')
+MARKDOWN_RENDER_SECONDS = Counter('blogengine_markdown_render_seconds', 'Time spent rendering Markdown.')
+MARKDOWN_CACHE = Counter('blogengine_markdown_cache_lookups',
+                         'Render cache lookups by result: hit, backend_hit or miss.', ['result'])
+PAGE_CACHE = Counter('blogengine_page_cache_lookups',
+                     'Page cache lookups by result: hit, not_modified or miss.', ['result'])
+DB_CONNECTIONS_CREATED = Counter('blogengine_db_connections_created',
+                                 'Database connections opened, by alias.', ['alias'])
+DB_CONNECTIONS_OPEN = Gauge('blogengine_db_connections_open',
+                            'Database connections held open between requests, by alias.', ['alias'])
+COMPRESSION_SECONDS = Histogram('blogengine_compression_duration_seconds',
+                                'Time to compress a response body, by URL name and encoding.', ['route', 'encoding'],
+                                buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1))
+COMPRESSION_RATIO = Histogram('blogengine_compression_ratio',
+                              'Compressed size over uncompressed size of response bodies, by URL name.', ['route'],
+                              buckets=(.1, .2, .3, .4, .5, .6, .7, .8, .9, 1))
+COMPRESSION_CACHE = Counter('blogengine_compression_lookups',
+                            'Stored compressed variant lookups by result: hit or miss.', ['result'])
+FLATPAGE_LOOKUPS = Counter('blogengine_flatpage_lookups',
+                           'Flatpage table lookups by result: hit, miss or negative (a remembered miss).',
+                           ['result'])
@@ -0,0 +1,330 @@
+import calendar
+import cProfile
+import hashlib
+import pstats
+import random
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.utils.six import StringIO
+
+from blogengine import compression, instrumentation, metrics, pagecache, routers
+
+
+def route_name(request, response=None):
+    """
+    Name a request by its URL pattern name, or its view if it has none.
+    """
+    match = getattr(request, 'resolver_match', None)
+
+    if match is None:
+        if response is not None and response.has_header('X-Page-Cache'):
+            return '(page cache)'
+        return '(unresolved)'
+
+    if match.url_name:
+        return match.url_name
+
+    return '{0}.{1}'.format(match.func.__module__, getattr(match.func, '__name__', match.func.__class__.__name__))
+
+
+class MetricsMiddleware(object):
+    """
+    Records the latency and status of every response by URL name.
+    Should be first in MIDDLEWARE_CLASSES so it times all the others.
+    """
+    def process_request(self, request):
+        request._metrics_started = time.time()
+
+    def process_response(self, request, response):
+        started = getattr(request, '_metrics_started', None)
+        if started is None:
+            return response
+
+        route = route_name(request, response)
+        metrics.REQUEST_LATENCY.observe(time.time() - started, route=route)
+        metrics.RESPONSES.inc(route=route, status=response.status_code)
+
+        return response
+
+
+class ProfilingMiddleware(object):
+    """
+    Splits each request's time into SQL, template and Markdown rendering,
+    counts its queries and spots queries run more than once.
+
+    Results go into the per-route aggregates behind the stats endpoint and
+    a Server-Timing header. Only BLOGENGINE_PROFILE_SAMPLE_RATE of the
+    requests are measured, and run under cProfile, as measuring keeps the
+    SQL of every query; the others pay for a random draw. Setting
+    BLOGENGINE_PROFILING measures every request, still running only the
+    sampled ones under cProfile. Should come straight after
+    MetricsMiddleware.
+    """
+    def process_request(self, request):
+        rate = getattr(settings, 'BLOGENGINE_PROFILE_SAMPLE_RATE', 0.0)
+        sampled = bool(rate) and random.random() < rate
+
+        if not sampled and not getattr(settings, 'BLOGENGINE_PROFILING', False):
+            return None
+
+        request._profiling = instrumentation.start()
+
+        # The debug cursor records the SQL and time of every query
+        request._profiling_connections = []
+        for connection in connections.all():
+            request._profiling_connections.append((connection, connection.use_debug_cursor, len(connection.queries)))
+            connection.use_debug_cursor = True
+
+        request._profiler = None
+        if sampled:
+            request._profiler = cProfile.Profile()
+            request._profiler.enable()
+
+        return None
+
+    def process_template_response(self, request, response):
+        stats = getattr(request, '_profiling', None)
+        if stats is None:
+            return response
+
+        db_before = self.query_time(request)
+        markdown_before = stats.timings['markdown']
+        started = time.time()
+
+        response.render()
+
+        # Lazy querysets and Markdown filters run during rendering
+        elapsed = time.time() - started
+        elapsed -= self.query_time(request) - db_before
+        elapsed -= stats.timings['markdown'] - markdown_before
+        instrumentation.track('template', max(elapsed, 0.0))
+
+        return response
+
+    def process_response(self, request, response):
+        stats = getattr(request, '_profiling', None)
+        if stats is None:
+            return response
+
+        request._profiling = None
+        instrumentation.finish()
+        total = time.time() - stats.started
+        route = route_name(request, response)
+
+        if request._profiler is not None:
+            request._profiler.disable()
+            report = StringIO()
+            pstats.Stats(request._profiler, stream=report).sort_stats('cumulative').print_stats(40)
+            instrumentation.aggregates.add_profile(route, request.get_full_path(), report.getvalue())
+
+        queries = self.queries(request)
+        for connection, use_debug_cursor, start in request._profiling_connections:
+            connection.use_debug_cursor = use_debug_cursor
+
+        timings = {
+            'total': total,
+            'db': sum(float(query['time']) for query in queries),
+            'template': stats.timings['template'],
+            'markdown': stats.timings['markdown'],
+        }
+        duplicates = len(queries) - len(set(query['sql'] for query in queries))
+        instrumentation.aggregates.add(route, timings, len(queries), duplicates)
+        metrics.DB_QUERIES.inc(len(queries), route=route)
+        metrics.DB_DUPLICATE_QUERIES.inc(duplicates, route=route)
+
+        response['Server-Timing'] = ', '.join('{0};dur={1:.2f}'.format(name, timings[name] * 1000)
+                                              for name in ('total', 'db', 'template', 'markdown'))
+
+        return response
+
+    def queries(self, request):
+        queries = []
+        for connection, use_debug_cursor, start in request._profiling_connections:
+            queries.extend(connection.queries[start:])
+
+        return queries
+
+    def query_time(self, request):
+        return sum(float(query['time']) for query in self.queries(request))
+
+
+class CompressionMiddleware(object):
+    """
+    Compresses text responses with the best encoding the client accepts.
+
+    Pages carrying an ETag from PageCacheMiddleware are compressed once per
+    encoding: the compressed body is stored under that ETag and served as
+    it is for as long as the page is unchanged, page cache hits included.
+    Should come before PageCacheMiddleware.
+    """
+    min_length = 200
+    content_types = ('text/', 'application/atom+xml', 'application/rss+xml', 'application/xml',
+                     'application/json', 'application/javascript')
+
+    def process_response(self, request, response):
+        if (response.status_code != 200 or response.streaming or response.has_header('Content-Encoding') or
+                not response.get('Content-Type', '').startswith(self.content_types) or
+                len(response.content) < self.min_length):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding', ))
+
+        encoding = compression.negotiate(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+
+        etag = response.get('ETag')
+        content = compression.stored_variant(etag, encoding) if etag else None
+
+        if content is not None:
+            metrics.COMPRESSION_CACHE.inc(result='hit')
+        else:
+            route = route_name(request, response)
+            started = time.time()
+            content = compression.encode(response.content, encoding)
+            metrics.COMPRESSION_SECONDS.observe(time.time() - started, route=route, encoding=encoding)
+            metrics.COMPRESSION_RATIO.observe(float(len(content)) / len(response.content), route=route)
+
+            if len(content) >= len(response.content):
+                return response
+
+            if etag:
+                metrics.COMPRESSION_CACHE.inc(result='miss')
+                compression.store_variant(etag, encoding, content, pagecache.page_timeout(response))
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        if etag:
+            response['ETag'] = compression.variant_etag(etag, encoding)
+
+        return response
+
+
+class ReplicaMiddleware(object):
+    """
+    Sends the reads of GET and HEAD requests to views marked with
+    routers.replica_reads to the read replica, template rendering
+    included. Should come before PageCacheMiddleware.
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in ('GET', 'HEAD') and getattr(view_func, 'replica_reads', False):
+            request._replica = routers.replica()
+            request._replica.__enter__()
+
+        return None
+
+    def process_response(self, request, response):
+        self.finish(request)
+        return response
+
+    def process_exception(self, request, exception):
+        self.finish(request)
+        return None
+
+    def finish(self, request):
+        context = getattr(request, '_replica', None)
+        if context is not None:
+            request._replica = None
+            context.__exit__(None, None, None)
+
+
+class PageCacheMiddleware(object):
+    """
+    Caches whole pages for anonymous GET requests.
+
+    Only responses tagged by their view (see blogengine.pagecache) are
+    stored. Cached and freshly rendered pages carry an ETag
+    and a Last-Modified header, and conditional requests matching a cached
+    page get a 304 without the view running.
+    """
+    def process_request(self, request):
+        if request.method not in ('GET', 'HEAD') or settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return None
+
+        key = pagecache.page_key(request)
+        request._page_cache_key = key
+
+        entry = pagecache.get_cache().get(key)
+        if entry is None or not pagecache.tokens_current(entry['tags']):
+            metrics.PAGE_CACHE.inc(result='miss')
+            return None
+
+        if self.not_modified(request, entry['etag'], entry['last_modified']):
+            metrics.PAGE_CACHE.inc(result='not_modified')
+            response = HttpResponseNotModified()
+        else:
+            metrics.PAGE_CACHE.inc(result='hit')
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            response['X-Page-Cache'] = 'hit'
+
+        if entry.get('cache_control'):
+            response['Cache-Control'] = entry['cache_control']
+
+        self.set_validators(response, entry['etag'], entry['last_modified'])
+        request._page_cache_key = None
+
+        return response
+
+    def process_response(self, request, response):
+        key = getattr(request, '_page_cache_key', None)
+
+        if key is None or response.status_code != 200 or response.streaming or response.cookies:
+            return response
+
+        tags = getattr(response, 'cache_tags', None)
+        if not tags:
+            return response
+
+        tokens = pagecache.tag_tokens(tags, create=True)
+        etag = hashlib.md5(response.content).hexdigest()
+        last_modified = self.last_modified(getattr(response, 'cache_last_modified', None), tokens)
+
+        if (request.method == 'GET' and None not in tokens.values() and
+                not (routers.reading_from_replica() and routers.replica_may_lag(tokens))):
+            pagecache.get_cache().set(key, {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': etag,
+                'last_modified': last_modified,
+                'tags': tokens,
+                'cache_control': response.get('Cache-Control'),
+            }, pagecache.page_timeout(response))
+
+        if self.not_modified(request, etag, last_modified):
+            response = HttpResponseNotModified()
+
+        self.set_validators(response, etag, last_modified)
+
+        return response
+
+    def last_modified(self, newest_pub_date, tokens):
+        """
+        The later of the newest pub_date on the page and the last time one
+        of its tags was invalidated, as a Unix timestamp.
+        """
+        times = [pagecache.token_time(token) for token in tokens.values() if token]
+        if newest_pub_date is not None:
+            times.append(calendar.timegm(newest_pub_date.utctimetuple()))
+
+        return int(max(times)) if times else None
+
+    def not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            # Compressed variants carry the ETag of the page plus ";gzip"
+            etags = [compression.strip_variant(tag) for tag in parse_etags(if_none_match)]
+            return etag in etags or '*' in etags
+
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and last_modified is not None and last_modified <= if_modified_since
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
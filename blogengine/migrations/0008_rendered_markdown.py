@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+
+import markdown
+
+from django.db import models, migrations
+from django.utils.encoding import force_bytes, force_text
+
+# A copy of blogengine.rendering as it stood when this migration was
+# written, so later changes to that module do not change what it does.
+# Should the configuration change, the hashes stop matching and the HTML
+# is redone by the next save or `render_markdown` run. Native strings, as
+# there, so the hashes match on Python 2.
+MARKDOWN_EXTENSIONS = (str('nl2br'), )
+MARKDOWN_OPTIONS = {
+    str('safe_mode'): True,
+    str('enable_attributes'): False,
+}
+
+
+def source_hash(text):
+    digest = hashlib.sha1()
+    digest.update(force_bytes(repr((MARKDOWN_EXTENSIONS, sorted(MARKDOWN_OPTIONS.items())))))
+    digest.update(b'\0')
+    digest.update(force_bytes(text))
+
+    return digest.hexdigest()
+
+
+def render_markdown(text):
+    return markdown.markdown(force_text(text), extensions=list(MARKDOWN_EXTENSIONS), **MARKDOWN_OPTIONS)
+
+
+def render_existing(apps, schema_editor):
+    Post = apps.get_model('blogengine', 'Post')
+    FlatPage = apps.get_model('flatpages', 'FlatPage')
+    FlatPageRendering = apps.get_model('blogengine', 'FlatPageRendering')
+
+    for post in Post.objects.all().iterator():
+        Post.objects.filter(pk=post.pk).update(
+            rendered_text=render_markdown(post.text),
+            text_hash=source_hash(post.text)
+        )
+
+    for flatpage in FlatPage.objects.all().iterator():
+        FlatPageRendering.objects.create(
+            flatpage=flatpage,
+            html=render_markdown(flatpage.content),
+            source_hash=source_hash(flatpage.content)
+        )
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flatpages', '0001_initial'),
+        ('blogengine', '0007_auto_20150108_2228'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='rendered_text',
+            field=models.TextField(editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_hash',
+            field=models.CharField(max_length=40, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.CreateModel(
+            name='FlatPageRendering',
+            fields=[
+                ('id', models.AutoField(serialize=False, primary_key=True, auto_created=True, verbose_name='ID')),
+                ('html', models.TextField(blank=True)),
+                ('source_hash', models.CharField(max_length=40, blank=True)),
+                ('flatpage', models.OneToOneField(related_name='rendering', to='flatpages.FlatPage')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(render_existing, noop),
+    ]
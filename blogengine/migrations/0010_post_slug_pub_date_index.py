@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogengine', '0009_post_ordering'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('slug', 'pub_date')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogengine', '0010_post_slug_pub_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('pub_date', 'id'), ('category', 'pub_date'), ('site', 'pub_date'), ('slug', 'pub_date')]),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations, DatabaseError
+
+# The search index as blogengine.search defined it when this migration was
+# written, so later changes to that module do not change what it does
+SQLITE_TABLE = 'blogengine_post_fts'
+POSTGRESQL_TABLE = 'blogengine_post_search'
+
+SQLITE_SQL = [
+    "CREATE VIRTUAL TABLE blogengine_post_fts USING fts5(title, text, tokenize='porter unicode61')",
+    'INSERT INTO blogengine_post_fts (rowid, title, text) SELECT id, title, text FROM blogengine_post',
+]
+
+POSTGRESQL_SQL = [
+    ('CREATE TABLE blogengine_post_search (post_id integer PRIMARY KEY REFERENCES blogengine_post (id) '
+     'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)'),
+    'CREATE INDEX blogengine_post_search_document ON blogengine_post_search USING gin (document)',
+    ("INSERT INTO blogengine_post_search (post_id, document) SELECT id, "
+     "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', text), 'B') "
+     "FROM blogengine_post"),
+]
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_SQL[0])
+        except DatabaseError:
+            # SQLite built without FTS5; search falls back to icontains
+            return
+        statements = SQLITE_SQL[1:]
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRESQL_SQL
+    else:
+        return
+
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    for table in (SQLITE_TABLE, POSTGRESQL_TABLE):
+        if table in schema_editor.connection.introspection.table_names():
+            schema_editor.execute('DROP TABLE {0}'.format(table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogengine', '0011_post_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
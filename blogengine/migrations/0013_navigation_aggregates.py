@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from django.db import models, migrations
+from django.utils import timezone
+
+
+def count_posts(apps, schema_editor):
+    ArchiveMonth = apps.get_model('blogengine', 'ArchiveMonth')
+    CategoryCount = apps.get_model('blogengine', 'CategoryCount')
+    Post = apps.get_model('blogengine', 'Post')
+
+    months = Counter()
+    categories = Counter()
+    for pub_date, category_id in Post.objects.values_list('pub_date', 'category_id').iterator():
+        if timezone.is_aware(pub_date):
+            pub_date = timezone.localtime(pub_date)
+        months[pub_date.year, pub_date.month] += 1
+        if category_id is not None:
+            categories[category_id] += 1
+
+    ArchiveMonth.objects.bulk_create([ArchiveMonth(year=year, month=month, post_count=count)
+                                      for (year, month), count in months.items()])
+    CategoryCount.objects.bulk_create([CategoryCount(category_id=category_id, post_count=count)
+                                       for category_id, count in categories.items()])
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogengine', '0012_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMonth',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('post_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-year', '-month'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivemonth',
+            unique_together=set([('year', 'month')]),
+        ),
+        migrations.CreateModel(
+            name='CategoryCount',
+            fields=[
+                ('category', models.OneToOneField(related_name='post_count', primary_key=True, serialize=False, to='blogengine.Category')),
+                ('post_count', models.IntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(count_posts, noop),
+    ]
@@ -1,8 +1,11 @@
 from django.contrib.auth.models import User
+from django.contrib.flatpages.models import FlatPage
 from django.contrib.sites.models import Site
 from django.db import models
 from django.utils.encoding import force_text
-from django.utils.text import slugify
+
+from blogengine import rendering
+from blogengine.slugs import SlugAllocator
 
 
 class Category(models.Model):
@@ -10,11 +13,11 @@ class Category(models.Model):
     description = models.TextField()
     slug = models.SlugField(max_length=40, unique=True, blank=True, null=True)
 
-    def save(self):
-        if not self.slug:
-            self.slug = slugify(force_text(self.name))
+    def save(self, *args, **kwargs):
+        if self.slug:
+            return super(Category, self).save(*args, **kwargs)
 
-        super(Category, self).save()
+        SlugAllocator(Category).save_unique(self, self.name, lambda: super(Category, self).save(*args, **kwargs))
 
     def get_absolute_url(self):
         return "/category/{0}".format(self.slug)
@@ -26,15 +29,55 @@ class Category(models.Model):
         verbose_name_plural = 'categories'
 
 
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Posts with their relations joined and the columns the list and
+        detail templates never read left out.
+        """
+        return self.select_related('category', 'site', 'author').defer('text', 'text_hash')
+
+
 class Post(models.Model):
     title = models.CharField(max_length=200)
     pub_date = models.DateTimeField()
     text = models.TextField()
+    rendered_text = models.TextField(blank=True, editable=False)
+    text_hash = models.CharField(max_length=40, blank=True, editable=False)
     slug = models.SlugField(max_length=40, unique=True)
     author = models.ForeignKey(User)
     site = models.ForeignKey(Site)
     category = models.ForeignKey(Category, blank=True, null=True)
 
+    objects = PostQuerySet.as_manager()
+
+    def render_text(self, force=False):
+        """
+        Refresh the stored HTML if the text or renderer configuration changed.
+
+        Returns True when the HTML was re-rendered.
+        """
+        digest = rendering.source_hash(self.text)
+
+        if not force and digest == self.text_hash:
+            return False
+
+        self.rendered_text = rendering.render_markdown(self.text)
+        self.text_hash = digest
+
+        return True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+
+        if self.render_text() and update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(['rendered_text', 'text_hash'])
+
+        if self.slug:
+            return super(Post, self).save(*args, **kwargs)
+
+        SlugAllocator(Post).save_unique(self, self.title, lambda: super(Post, self).save(*args, **kwargs))
+
     def get_absolute_url(self):
         return "/{0}/{1}/{2}/".format(self.pub_date.year, self.pub_date.month, self.slug)
 
@@ -42,4 +85,72 @@ class Post(models.Model):
         return self.title
 
     class Meta:
-        ordering = ['-pub_date']
+        # The trailing id makes the ordering unique, which keyset pagination needs
+        ordering = ['-pub_date', '-id']
+        index_together = [
+            # Index pages and feeds
+            ('pub_date', 'id'),
+            # Category pages
+            ('category', 'pub_date'),
+            # Per-site listings
+            ('site', 'pub_date'),
+            # Post detail lookups
+            ('slug', 'pub_date'),
+        ]
+
+
+class ArchiveMonth(models.Model):
+    """
+    Number of posts published in a month, kept up to date by the post
+    signals for the archive navigation.
+    """
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    post_count = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return '{0}-{1:02d}'.format(self.year, self.month)
+
+    class Meta:
+        ordering = ['-year', '-month']
+        unique_together = ('year', 'month')
+
+
+class CategoryCount(models.Model):
+    """
+    Number of posts in a category, kept up to date by the post signals for
+    the category navigation.
+    """
+    category = models.OneToOneField(Category, primary_key=True, related_name='post_count')
+    post_count = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return force_text(self.category)
+
+
+class FlatPageRendering(models.Model):
+    """
+    Stored HTML for a flatpage's Markdown content.
+    """
+    flatpage = models.OneToOneField(FlatPage, related_name='rendering')
+    html = models.TextField(blank=True)
+    source_hash = models.CharField(max_length=40, blank=True)
+
+    @classmethod
+    def refresh(cls, flatpage, force=False):
+        digest = rendering.source_hash(flatpage.content)
+
+        try:
+            stored = cls.objects.get(flatpage=flatpage)
+        except cls.DoesNotExist:
+            stored = cls(flatpage=flatpage)
+
+        if force or stored.pk is None or stored.source_hash != digest:
+            stored.html = rendering.render_markdown(flatpage.content)
+            stored.source_hash = digest
+            stored.save()
+
+        return stored
+
+    def __unicode__(self):
+        return force_text(self.flatpage)
@@ -0,0 +1,112 @@
+"""
+Tag-based invalidation for the page cache.
+
+Views tag their responses with the rows they show ('post:12',
+'category:3', 'index'...). Each tag has a token in the cache that is
+replaced whenever one of its rows changes. A cached page stores the
+tokens it was rendered with and is only served while they all still
+match, so a change invalidates exactly the pages carrying its tags.
+
+The tokens only reach every worker process through a cache backend they
+all share, such as memcached. With a per-process backend a change made
+through one worker is invisible to the others, which go on serving their
+copies until BLOGENGINE_PAGE_CACHE_TIMEOUT.
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils.encoding import force_bytes
+
+TAG_PREFIX = 'blogengine:tag:'
+PAGE_PREFIX = 'blogengine:page:'
+
+
+def get_cache():
+    return caches[getattr(settings, 'BLOGENGINE_PAGE_CACHE', 'default')]
+
+
+def tag_response(response, tags, last_modified=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Mark a response as cacheable under the given tags.
+
+    last_modified is the newest publication date shown on the page.
+    timeout overrides BLOGENGINE_PAGE_CACHE_TIMEOUT; None keeps the page
+    until one of its tags is invalidated.
+    """
+    response.cache_tags = set(getattr(response, 'cache_tags', ())) | set(tags)
+    response.cache_last_modified = last_modified
+    response.cache_timeout = timeout
+
+    return response
+
+
+def page_timeout(response):
+    timeout = getattr(response, 'cache_timeout', DEFAULT_TIMEOUT)
+
+    if timeout is DEFAULT_TIMEOUT:
+        return getattr(settings, 'BLOGENGINE_PAGE_CACHE_TIMEOUT', 600)
+
+    return timeout
+
+
+def new_token():
+    return '{0:.6f}:{1}'.format(time.time(), uuid.uuid4().hex[:8])
+
+
+def invalidate(*tags):
+    """
+    Invalidate every cached page carrying any of the given tags.
+    """
+    token = new_token()
+    get_cache().set_many(dict((TAG_PREFIX + tag, token) for tag in tags), None)
+
+
+def tag_tokens(tags, create=False):
+    """
+    Return a dict of the current token of each tag, None if it has none.
+
+    With create, tags without a token are given one first. Pages must be
+    stored with real tokens: a page stored against a missing one would
+    match again whenever that tag's token is evicted.
+    """
+    cache = get_cache()
+    keys = [TAG_PREFIX + tag for tag in tags]
+    found = cache.get_many(keys)
+
+    missing = [key for key in keys if found.get(key) is None]
+    if create and missing:
+        for key in missing:
+            # add() keeps a token another process created meanwhile
+            cache.add(key, new_token(), None)
+        found.update(cache.get_many(missing))
+
+    return dict((tag, found.get(TAG_PREFIX + tag)) for tag in tags)
+
+
+def tokens_current(tokens):
+    """
+    Whether the tokens a page was stored with are all still current. A
+    missing token, such as an evicted one, never matches.
+    """
+    if None in tokens.values():
+        return False
+
+    return tag_tokens(tokens) == tokens
+
+
+def token_time(token):
+    """
+    Return the Unix time at which a tag token was issued.
+    """
+    return float(token.split(':', 1)[0])
+
+
+def page_key(request):
+    site_id = getattr(settings, 'SITE_ID', 1)
+    digest = hashlib.md5(force_bytes('{0}:{1}'.format(site_id, request.get_full_path())))
+
+    return PAGE_PREFIX + digest.hexdigest()
@@ -0,0 +1,194 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage
+from django.db.models import Q
+from django.utils import six
+from django.utils.encoding import force_bytes, force_text
+
+# JSON types a cursor value may have; anything else is not a key value
+CURSOR_VALUE_TYPES = six.string_types + six.integer_types + (float, )
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage(object):
+    """
+    A page of results from a KeysetPaginator.
+
+    Mirrors the parts of django.core.paginator.Page used by the templates,
+    but has no page numbers: neighbouring pages are addressed by opaque
+    cursors built from the first and last rows.
+    """
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Keyset page of {0} objects>'.format(len(self.object_list))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+
+        return self.paginator.encode_cursor('next', self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+
+        return self.paginator.encode_cursor('previous', self.object_list[0])
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a queryset by seeking on its ordering keys.
+
+    Each page is a single "WHERE key < cursor ORDER BY key LIMIT n + 1"
+    query, so deep pages cost the same as the first one and no COUNT is
+    ever issued. The ordering defaults to the model's Meta.ordering, which
+    must end in a unique field so that every row has a distinct key.
+    """
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.model = queryset.model
+        self.keys = []
+
+        for name in ordering or self.model._meta.ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                name = self.model._meta.pk.name
+            self.keys.append((name, descending))
+
+    def ordering(self, reverse=False):
+        return ['-' + name if descending != reverse else name for name, descending in self.keys]
+
+    def seek(self, values, forward=True):
+        """
+        Return a Q object selecting rows after (or before) the given key.
+        """
+        condition = None
+        equal = {}
+
+        for (name, descending), value in zip(self.keys, values):
+            lookup = '{0}__{1}'.format(name, 'lt' if descending == forward else 'gt')
+            clause = dict(equal)
+            clause[lookup] = value
+            condition = Q(**clause) if condition is None else condition | Q(**clause)
+            equal[name] = value
+
+        return condition
+
+    def encode_cursor(self, direction, obj):
+        values = []
+        for name, descending in self.keys:
+            value = getattr(obj, name)
+            # Keep full precision: the cursor is compared for equality
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+
+        data = json.dumps([direction, values])
+
+        return force_text(base64.urlsafe_b64encode(force_bytes(data))).rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = force_bytes(cursor) + b'=' * (-len(cursor) % 4)
+            direction, values = json.loads(force_text(base64.urlsafe_b64decode(padded)))
+            if direction not in ('next', 'previous') or not isinstance(values, list) or len(values) != len(self.keys):
+                raise ValueError(cursor)
+            if any(isinstance(value, bool) or not isinstance(value, CURSOR_VALUE_TYPES) for value in values):
+                raise ValueError(cursor)
+
+            values = [self.model._meta.get_field(name).to_python(value)
+                      for (name, descending), value in zip(self.keys, values)]
+            if None in values:
+                raise ValueError(cursor)
+        except (TypeError, ValueError, ValidationError):
+            raise InvalidCursor(cursor)
+
+        return direction, values
+
+    def page_queryset(self, direction=None, values=None):
+        """
+        Return the queryset for a page, including the extra row used to
+        tell whether there are more rows in that direction.
+        """
+        if direction is None:
+            return self.queryset.order_by(*self.ordering())[:self.per_page + 1]
+
+        forward = direction == 'next'
+        queryset = self.queryset.filter(self.seek(values, forward))
+
+        return queryset.order_by(*self.ordering(reverse=not forward))[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        """
+        Return the page following a 'next' cursor or preceding a 'previous'
+        cursor, or the first page if no cursor is given. Raises EmptyPage
+        when no rows lie beyond the cursor.
+        """
+        if not cursor:
+            rows = list(self.page_queryset())
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+
+        direction, values = self.decode_cursor(cursor)
+        rows = list(self.page_queryset(direction, values))
+        if not rows:
+            raise EmptyPage("That page contains no results")
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == 'next':
+            return KeysetPage(rows, self, has_more, True)
+
+        rows.reverse()
+        return KeysetPage(rows, self, True, has_more)
+
+    def iterator(self):
+        """
+        Yield every row of the queryset, fetching per_page rows at a time.
+
+        Memory use is bounded by the page size however large the table is,
+        without needing server-side cursor support from the backend.
+        """
+        values = None
+
+        while True:
+            rows = list(self.page_queryset('next' if values else None, values))
+
+            for row in rows[:self.per_page]:
+                yield row
+
+            if len(rows) <= self.per_page:
+                return
+
+            last = rows[self.per_page - 1]
+            values = [getattr(last, name) for name, descending in self.keys]
@@ -0,0 +1,186 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import markdown
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.encoding import force_bytes, force_text
+
+from blogengine import instrumentation, metrics
+
+# The renderer configuration shared by the template filter and the stored
+# HTML on posts and flatpages. Changing it changes every source hash, so
+# stale HTML is picked up by the next save or `render_markdown` run.
+MARKDOWN_EXTENSIONS = ('nl2br', )
+MARKDOWN_OPTIONS = {
+    'safe_mode': True,
+    'enable_attributes': False,
+}
+
+
+def source_hash(text):
+    """
+    Return a hex digest of the Markdown source and the renderer configuration.
+    """
+    digest = hashlib.sha1()
+    digest.update(force_bytes(repr((MARKDOWN_EXTENSIONS, sorted(MARKDOWN_OPTIONS.items())))))
+    digest.update(b'\0')
+    digest.update(force_bytes(text))
+
+    return digest.hexdigest()
+
+
+def render_markdown(text):
+    """
+    Render Markdown source to HTML with the blog's extensions and options.
+    """
+    started = time.time()
+    html = markdown.markdown(force_text(text),
+                             extensions=list(MARKDOWN_EXTENSIONS),
+                             **MARKDOWN_OPTIONS)
+    elapsed = time.time() - started
+    instrumentation.track('markdown', elapsed)
+    metrics.MARKDOWN_RENDERS.inc()
+    metrics.MARKDOWN_RENDER_SECONDS.inc(elapsed)
+
+    return html
+
+
+class RenderCache(object):
+    """
+    Content-addressed cache of rendered Markdown.
+
+    The first tier is a per-process LRU bounded by the total size of the
+    cached HTML in UTF-8 bytes. The optional second tier is a Django cache backend shared
+    between worker processes, so a text is rendered once per cluster.
+    """
+    key_prefix = 'blogengine:markdown:'
+
+    def __init__(self, max_bytes, backend_alias=None, timeout=None):
+        self.max_bytes = max_bytes
+        self.backend_alias = backend_alias
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def backend(self):
+        if self.backend_alias is None:
+            return None
+
+        return caches[self.backend_alias]
+
+    def render(self, text):
+        key = source_hash(text)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Move the entry to the most recently used end
+                del self._entries[key]
+                self._entries[key] = entry
+                html = entry[0]
+                self.hits += 1
+                metrics.MARKDOWN_CACHE.inc(result='hit')
+                return html
+
+        backend = self.backend
+        if backend is not None:
+            html = backend.get(self.key_prefix + key)
+            if html is not None:
+                with self._lock:
+                    self.backend_hits += 1
+                metrics.MARKDOWN_CACHE.inc(result='backend_hit')
+                self._store(key, html)
+                return html
+
+        html = render_markdown(text)
+
+        with self._lock:
+            self.misses += 1
+        metrics.MARKDOWN_CACHE.inc(result='miss')
+        self._store(key, html)
+
+        if backend is not None:
+            if self.timeout is None:
+                backend.set(self.key_prefix + key, html)
+            else:
+                backend.set(self.key_prefix + key, html, self.timeout)
+
+        return html
+
+    def _store(self, key, html):
+        # The limit is on the UTF-8 size, not the number of characters
+        size = len(force_bytes(html))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+
+            self._entries[key] = (html, size)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                evicted_key, (evicted, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'backend_hits': self.backend_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_render_cache = None
+
+
+def get_render_cache():
+    global _render_cache
+
+    if _render_cache is None:
+        _render_cache = RenderCache(
+            getattr(settings, 'BLOGENGINE_MARKDOWN_CACHE_BYTES', 4 * 1024 * 1024),
+            getattr(settings, 'BLOGENGINE_MARKDOWN_CACHE_BACKEND', None),
+            getattr(settings, 'BLOGENGINE_MARKDOWN_CACHE_TIMEOUT', None)
+        )
+
+    return _render_cache
+
+
+def render_markdown_cached(text):
+    """
+    Render Markdown source through the process-wide render cache.
+    """
+    return get_render_cache().render(text)
+
+
+@receiver(setting_changed)
+def reset_render_cache(sender, setting, **kwargs):
+    global _render_cache
+
+    if setting.startswith('BLOGENGINE_MARKDOWN_CACHE'):
+        _render_cache = None
@@ -0,0 +1,100 @@
+"""
+Routes the reads of the public views to a read replica.
+
+Views wrapped with replica_reads() run with a thread-local flag set by
+ReplicaMiddleware; while it is set, ReplicaRouter sends reads to the
+BLOGENGINE_READ_REPLICA alias. Everything else, the admin included, reads
+and writes the default database. Without that alias in DATABASES all
+queries go to the default database.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from blogengine import pagecache
+
+_local = threading.local()
+
+
+def replica_alias():
+    """
+    Return the alias of the read replica, or None when there is none.
+    """
+    alias = getattr(settings, 'BLOGENGINE_READ_REPLICA', None)
+
+    if alias is None or alias not in settings.DATABASES:
+        return None
+
+    return alias
+
+
+def reading_from_replica():
+    return getattr(_local, 'replica', False) and replica_alias() is not None
+
+
+@contextmanager
+def replica():
+    """
+    Send reads to the replica within the block.
+    """
+    previous = getattr(_local, 'replica', False)
+    _local.replica = True
+
+    try:
+        yield
+    finally:
+        _local.replica = previous
+
+
+def iterate_on_replica(iterable):
+    """
+    Iterate with reads sent to the replica, for responses streamed after
+    the middleware has finished.
+    """
+    with replica():
+        for item in iterable:
+            yield item
+
+
+def replica_reads(view):
+    """
+    Mark a view whose GET and HEAD requests can read from the replica.
+    """
+    view.replica_reads = True
+
+    return view
+
+
+def replica_may_lag(tokens):
+    """
+    Whether a page read from the replica with the given tag tokens might
+    predate a write the tokens record. Such pages are not cached.
+    """
+    if replica_alias() is None:
+        return False
+
+    lag = getattr(settings, 'BLOGENGINE_REPLICA_LAG', 5)
+    newest = max([pagecache.token_time(token) for token in tokens.values() if token] or [0])
+
+    return newest > time.time() - lag
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return replica_alias()
+
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the default database
+        return True
+
+    def allow_migrate(self, db, model):
+        return db != replica_alias()
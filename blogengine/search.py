@@ -0,0 +1,166 @@
+"""
+Full-text search over post titles and text.
+
+Posts are indexed into an FTS5 virtual table on SQLite and a tsvector
+table with a GIN index on PostgreSQL. The index is kept current by the
+post save and delete signals, and can be rebuilt in bulk. Other
+backends, or SQLite builds without FTS5, fall back to icontains.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+from blogengine.models import Post
+
+SQLITE_TABLE = 'blogengine_post_fts'
+POSTGRESQL_TABLE = 'blogengine_post_search'
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query, re.UNICODE)
+
+
+class SearchBackend(object):
+    """
+    Scans the post table with icontains; used when there is no index.
+    """
+    def __init__(self, using):
+        self.using = using
+        self.connection = connections[using]
+
+    def index_posts(self, posts):
+        pass
+
+    def remove_posts(self, pks):
+        pass
+
+    def reindex(self, after_pk=None):
+        """
+        Rebuild the index for every post, or only posts with a larger pk.
+        """
+        pass
+
+    def search_statement(self, query, offset, limit):
+        """
+        Return the (sql, params) selecting the pks of matching posts, best
+        match first, or None when the query has no terms.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return None
+
+        queryset = Post.objects.using(self.using)
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(text__icontains=term))
+
+        return queryset.values_list('pk', flat=True)[offset:offset + limit].query.sql_with_params()
+
+    def search(self, query, offset, limit):
+        """
+        Return the pks of matching posts, best match first.
+        """
+        statement = self.search_statement(query, offset, limit)
+        if statement is None:
+            return []
+
+        cursor = self.connection.cursor()
+        cursor.execute(*statement)
+
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteSearchBackend(SearchBackend):
+    create_sql = ("CREATE VIRTUAL TABLE {0} USING fts5(title, text, tokenize='porter unicode61')"
+                  .format(SQLITE_TABLE))
+
+    def index_posts(self, posts):
+        posts = list(posts)
+        self.remove_posts([post.pk for post in posts])
+
+        cursor = self.connection.cursor()
+        cursor.executemany('INSERT INTO {0} (rowid, title, text) VALUES (%s, %s, %s)'.format(SQLITE_TABLE),
+                           [(post.pk, post.title, post.text) for post in posts])
+
+    def remove_posts(self, pks):
+        cursor = self.connection.cursor()
+        cursor.executemany('DELETE FROM {0} WHERE rowid = %s'.format(SQLITE_TABLE), [(pk, ) for pk in pks])
+
+    def reindex(self, after_pk=None):
+        after_pk = after_pk or 0
+        cursor = self.connection.cursor()
+        cursor.execute('DELETE FROM {0} WHERE rowid > %s'.format(SQLITE_TABLE), [after_pk])
+        cursor.execute('INSERT INTO {0} (rowid, title, text) SELECT id, title, text FROM {1} WHERE id > %s'
+                       .format(SQLITE_TABLE, Post._meta.db_table), [after_pk])
+
+    def search_statement(self, query, offset, limit):
+        terms = search_terms(query)
+        if not terms:
+            return None
+
+        # Quote each term so FTS5 query syntax in the input is not interpreted
+        match = ' '.join('"{0}"'.format(term) for term in terms)
+
+        return ('SELECT rowid FROM {0} WHERE {0} MATCH %s ORDER BY bm25({0}, 10.0, 1.0) LIMIT %s OFFSET %s'
+                .format(SQLITE_TABLE), [match, limit, offset])
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    create_sql = [
+        ('CREATE TABLE {0} (post_id integer PRIMARY KEY REFERENCES {1} (id) '
+         'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)')
+        .format(POSTGRESQL_TABLE, Post._meta.db_table),
+        'CREATE INDEX {0}_document ON {0} USING gin (document)'.format(POSTGRESQL_TABLE),
+    ]
+    document_sql = "setweight(to_tsvector('english', {0}), 'A') || setweight(to_tsvector('english', {1}), 'B')"
+
+    def index_posts(self, posts):
+        posts = list(posts)
+        self.remove_posts([post.pk for post in posts])
+
+        cursor = self.connection.cursor()
+        cursor.executemany('INSERT INTO {0} (post_id, document) SELECT %s, {1}'
+                           .format(POSTGRESQL_TABLE, self.document_sql.format('%s', '%s')),
+                           [(post.pk, post.title, post.text) for post in posts])
+
+    def remove_posts(self, pks):
+        if pks:
+            cursor = self.connection.cursor()
+            cursor.execute('DELETE FROM {0} WHERE post_id = ANY(%s)'.format(POSTGRESQL_TABLE), [list(pks)])
+
+    def reindex(self, after_pk=None):
+        after_pk = after_pk or 0
+        cursor = self.connection.cursor()
+        cursor.execute('DELETE FROM {0} WHERE post_id > %s'.format(POSTGRESQL_TABLE), [after_pk])
+        cursor.execute('INSERT INTO {0} (post_id, document) SELECT id, {1} FROM {2} WHERE id > %s'
+                       .format(POSTGRESQL_TABLE, self.document_sql.format('title', 'text'), Post._meta.db_table),
+                       [after_pk])
+
+    def search_statement(self, query, offset, limit):
+        if not search_terms(query):
+            return None
+
+        return ("SELECT post_id FROM {0}, plainto_tsquery('english', %s) query "
+                "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, post_id DESC "
+                "LIMIT %s OFFSET %s".format(POSTGRESQL_TABLE), [query, limit, offset])
+
+
+_backends = {}
+
+
+def get_backend(using='default'):
+    """
+    Return the search backend for a database alias.
+    """
+    if using not in _backends:
+        connection = connections[using]
+        tables = connection.introspection.table_names()
+
+        if connection.vendor == 'sqlite' and SQLITE_TABLE in tables:
+            _backends[using] = SQLiteSearchBackend(using)
+        elif connection.vendor == 'postgresql' and POSTGRESQL_TABLE in tables:
+            _backends[using] = PostgreSQLSearchBackend(using)
+        else:
+            _backends[using] = SearchBackend(using)
+
+    return _backends[using]
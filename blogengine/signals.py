@@ -0,0 +1,162 @@
+from collections import Counter
+
+from django.contrib.flatpages.models import FlatPage
+from django.core.signals import request_finished
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from blogengine import aggregates, metrics, pagecache, search
+from blogengine.sitemaps import shard_tag, shard_for
+from blogengine.lookups import category_slugs, flatpage_table
+from blogengine.models import Category, FlatPageRendering, Post
+
+
+@receiver(post_save, sender=FlatPage)
+def render_flatpage(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    FlatPageRendering.refresh(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_slugs(sender, **kwargs):
+    category_slugs.invalidate()
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_placement(sender, instance, raw=False, **kwargs):
+    """
+    Keep the category and pub_date the post had before this save, so the
+    pages it is leaving can be invalidated too.
+    """
+    instance._previous_placement = None
+
+    if instance.pk is not None and not raw:
+        instance._previous_placement = (Post.objects.filter(pk=instance.pk)
+                                                    .values_list('category_id', 'pub_date')
+                                                    .first())
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post(sender, instance, created, **kwargs):
+    tags = set(['post:{0}'.format(instance.pk), shard_tag(shard_for(instance.pk))])
+    placement = (instance.category_id, instance.pub_date)
+    previous = getattr(instance, '_previous_placement', None)
+
+    if created or previous != placement:
+        # The post moved within, into or out of the lists it appears in
+        tags.add('index')
+        for category_id, pub_date in filter(None, [placement, previous]):
+            tags.update(aggregates.archive_tags(pub_date))
+            if category_id is not None:
+                tags.add('category:{0}'.format(category_id))
+
+    pagecache.invalidate(*tags)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    tags = ['post:{0}'.format(instance.pk), shard_tag(shard_for(instance.pk)), 'index']
+    tags += aggregates.archive_tags(instance.pub_date)
+    if instance.category_id is not None:
+        tags.append('category:{0}'.format(instance.category_id))
+
+    pagecache.invalidate(*tags)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    pagecache.invalidate('categories', 'category:{0}'.format(instance.pk))
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+
+    months = Counter([aggregates.archive_month(instance.pub_date)])
+    categories = Counter([instance.category_id])
+
+    previous = getattr(instance, '_previous_placement', None)
+    if not created and previous is not None:
+        months[aggregates.archive_month(previous[1])] -= 1
+        categories[previous[0]] -= 1
+
+    aggregates.count_posts(months, categories, using)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, using='default', **kwargs):
+    aggregates.count_posts(Counter({aggregates.archive_month(instance.pub_date): -1}),
+                           Counter({instance.category_id: -1}), using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_category_navigation(sender, raw=False, using='default', **kwargs):
+    if not raw:
+        aggregates.refresh_navigation(using)
+
+
+@receiver(post_save, sender=FlatPage)
+@receiver(post_delete, sender=FlatPage)
+@receiver(m2m_changed, sender=FlatPage.sites.through)
+def invalidate_flatpages(sender, action='post_save', **kwargs):
+    if action.startswith('pre_'):
+        return
+
+    # Also makes every process reload its flatpage table
+    pagecache.invalidate('flatpages')
+    flatpage_table.invalidate()
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        search.get_backend(using).index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, using='default', **kwargs):
+    search.get_backend(using).remove_posts([instance.pk])
+
+
+def bulk_posts_created(after_pk, category_ids, using='default'):
+    """
+    Do the work of the post_save receivers for posts inserted with
+    bulk_create, which sends no signals: every post with a pk above
+    after_pk is new.
+    """
+    with transaction.atomic(using=using):
+        search.get_backend(using).reindex(after_pk=after_pk)
+
+    last_pk = Post.objects.using(using).order_by('-pk').values_list('pk', flat=True).first() or 0
+    shards = range(shard_for(after_pk + 1), shard_for(last_pk) + 1)
+
+    months, categories = aggregates.tally(Post.objects.using(using).filter(pk__gt=after_pk))
+
+    tags = ['index'] + ['category:{0}'.format(pk) for pk in category_ids]
+    tags += [shard_tag(shard) for shard in shards]
+    tags += set(aggregates.archive_tag(year) for year, month in months)
+    tags += [aggregates.archive_tag(year, month) for year, month in months]
+
+    pagecache.invalidate(*tags)
+    aggregates.count_posts(months, categories, using)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    metrics.DB_CONNECTIONS_CREATED.inc(alias=connection.alias)
+    metrics.DB_CONNECTIONS_OPEN.set(1, alias=connection.alias)
+
+
+@receiver(request_finished)
+def record_open_connections(sender, **kwargs):
+    # Runs after Django has closed connections past CONN_MAX_AGE
+    for connection in connections.all():
+        metrics.DB_CONNECTIONS_OPEN.set(int(connection.connection is not None), alias=connection.alias)
@@ -0,0 +1,134 @@
+"""
+Sitemaps for the index, categories, flatpages and every post.
+
+Posts are split into shards of SHARD_SIZE consecutive ids, listed by a
+sitemap index. A shard's URLs only change when one of its posts does, so
+each shard is cached until the post signals invalidate it. Shards are
+streamed in keyset batches and never hold the post table in memory.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.db.models import Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.html import escape
+
+from blogengine import pagecache, routers
+from blogengine.models import Category, Post
+from blogengine.pagination import KeysetPaginator
+
+SHARD_SIZE = 50000
+BATCH_SIZE = 2000
+CONTENT_TYPE = 'application/xml; charset=utf-8'
+CACHE_PREFIX = 'blogengine:sitemap:'
+
+
+def shard_for(pk):
+    return (pk - 1) // SHARD_SIZE + 1
+
+
+def shard_tag(shard):
+    return 'sitemap:{0}'.format(shard)
+
+
+def cached_stream(request, name, tags, chunks):
+    """
+    Serve a cached document if its tags are unchanged, or stream it from
+    chunks and cache it once it has been sent in full.
+    """
+    key = '{0}{1}:{2}'.format(CACHE_PREFIX, settings.SITE_ID, name)
+    cache = pagecache.get_cache()
+    tokens = pagecache.tag_tokens(tags, create=True)
+
+    cached = cache.get(key)
+    if cached is not None and None not in tokens.values() and cached['tags'] == tokens:
+        return HttpResponse(cached['content'], content_type=CONTENT_TYPE)
+
+    def stream():
+        sent = []
+        for chunk in routers.iterate_on_replica(chunks):
+            sent.append(chunk)
+            yield chunk
+
+        if None not in tokens.values() and not routers.replica_may_lag(tokens):
+            cache.set(key, {'content': ''.join(sent), 'tags': tokens}, None)
+
+    return StreamingHttpResponse(stream(), content_type=CONTENT_TYPE)
+
+
+def url_entry(request, location, lastmod=None):
+    entry = '<url><loc>{0}</loc>'.format(escape(request.build_absolute_uri(location)))
+    if lastmod is not None:
+        entry += '<lastmod>{0}</lastmod>'.format(lastmod.date().isoformat())
+
+    return entry + '</url>'
+
+
+@routers.replica_reads
+def sitemap_index(request):
+    def chunks():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        yield '<sitemap><loc>{0}</loc></sitemap>'.format(escape(request.build_absolute_uri('/sitemap-pages.xml')))
+
+        shards = (Post.objects.filter(site_id=settings.SITE_ID)
+                              .extra(select={'shard': '(id - 1) / %s + 1'}, select_params=(SHARD_SIZE, ))
+                              .values('shard')
+                              .annotate(lastmod=Max('pub_date'))
+                              .order_by('shard'))
+
+        for shard in shards:
+            yield '<sitemap><loc>{0}</loc><lastmod>{1}</lastmod></sitemap>'.format(
+                escape(request.build_absolute_uri('/sitemap-posts-{0}.xml'.format(shard['shard']))),
+                shard['lastmod'].date().isoformat()
+            )
+
+        yield '</sitemapindex>\n'
+
+    # Shards appear, disappear and change lastmod only when the index does
+    return cached_stream(request, 'index', ['index'], chunks())
+
+
+@routers.replica_reads
+def sitemap_pages(request):
+    def chunks():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        yield url_entry(request, '/', Post.objects.filter(site_id=settings.SITE_ID)
+                                                  .values_list('pub_date', flat=True)
+                                                  .first())
+
+        for category in Category.objects.exclude(slug=None).iterator():
+            yield url_entry(request, category.get_absolute_url())
+
+        flatpages = FlatPage.objects.filter(sites=settings.SITE_ID, registration_required=False)
+        for url in flatpages.values_list('url', flat=True).iterator():
+            yield url_entry(request, url)
+
+        yield '</urlset>\n'
+
+    return cached_stream(request, 'pages', ['index', 'categories', 'flatpages'], chunks())
+
+
+@routers.replica_reads
+def sitemap_posts(request, shard):
+    shard = int(shard)
+    posts = (Post.objects.filter(site_id=settings.SITE_ID,
+                                 pk__gt=(shard - 1) * SHARD_SIZE,
+                                 pk__lte=shard * SHARD_SIZE)
+                         .only('slug', 'pub_date'))
+
+    if shard < 1 or not posts.exists():
+        raise Http404("No such sitemap.")
+
+    def chunks():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+
+        for post in KeysetPaginator(posts, BATCH_SIZE, ordering=['pk']).iterator():
+            yield url_entry(request, post.get_absolute_url(), post.pub_date)
+
+        yield '</urlset>\n'
+
+    return cached_stream(request, 'posts-{0}'.format(shard), [shard_tag(shard)], chunks())
@@ -0,0 +1,116 @@
+"""
+Unique slug allocation shared by categories, posts and bulk imports.
+
+Slugs taken in the database are looked up once per batch with prefix
+queries, then numeric suffixes are handed out in memory. Concurrent
+writers can still race for the same slug, so saves retry on integrity
+errors.
+"""
+import re
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.text import slugify
+
+# Room kept at the end of a slug for a suffix such as "-12"
+SUFFIX_LENGTH = 8
+
+# Bases per prefix query, to stay well inside SQLite's expression depth limit
+QUERY_CHUNK_SIZE = 200
+
+# Sorts after every character a slug can hold, so with SQLite's binary
+# collation the slugs starting with a prefix are those from the prefix up
+# to the prefix plus this
+PREFIX_END = six.unichr(0xffff)
+
+
+class SlugAllocator(object):
+    def __init__(self, model, field_name='slug'):
+        self.model = model
+        self.field_name = field_name
+        self.max_length = model._meta.get_field(field_name).max_length
+
+    def base_slug(self, value):
+        return slugify(force_text(value))[:self.max_length] or self.model._meta.model_name
+
+    def prefix(self, base):
+        return base[:self.max_length - SUFFIX_LENGTH]
+
+    def taken_slugs(self, bases):
+        """
+        Return the slugs in the database that could clash with the bases.
+        """
+        prefixes = sorted(set(self.prefix(base) for base in bases))
+        manager = self.model._default_manager
+        taken = set()
+
+        for start in range(0, len(prefixes), QUERY_CHUNK_SIZE):
+            condition = Q()
+            for prefix in prefixes[start:start + QUERY_CHUNK_SIZE]:
+                condition |= self.prefix_condition(prefix, connections[manager.db].vendor)
+
+            taken.update(manager.filter(condition).values_list(self.field_name, flat=True))
+
+        return taken
+
+    def prefix_condition(self, prefix, vendor):
+        if vendor == 'sqlite':
+            # Django's LIKE ... ESCAPE cannot use the slug index on SQLite,
+            # which compares text bytewise, so a range finds the same rows
+            return Q(**{self.field_name + '__gte': prefix, self.field_name + '__lt': prefix + PREFIX_END})
+
+        # Locale collations do not sort like the range assumes; PostgreSQL
+        # serves LIKE from the varchar_pattern_ops index Django creates
+        return Q(**{self.field_name + '__startswith': prefix})
+
+    def allocate(self, values):
+        """
+        Return a unique slug for each value, in order.
+
+        Values that slugify to the same base get "-2", "-3"... suffixes
+        after any already taken.
+        """
+        bases = [self.base_slug(value) for value in values]
+        taken = self.taken_slugs(bases)
+        slugs = []
+
+        for base in bases:
+            slug = self.next_free(base, taken)
+            taken.add(slug)
+            slugs.append(slug)
+
+        return slugs
+
+    def next_free(self, base, taken):
+        if base not in taken:
+            return base
+
+        pattern = re.compile(r'^{0}-(\d+)$'.format(re.escape(self.prefix(base))))
+        numbers = [int(match.group(1)) for match in map(pattern.match, taken) if match]
+        number = max(numbers + [1]) + 1
+
+        while True:
+            tail = '-{0}'.format(number)
+            slug = base[:self.max_length - len(tail)] + tail
+            if slug not in taken:
+                return slug
+            number += 1
+
+    def save_unique(self, instance, value, save, attempts=5):
+        """
+        Give the instance a unique slug from value and call save(),
+        allocating again if another writer took the slug first.
+        """
+        for attempt in range(attempts):
+            slug = self.allocate([value])[0]
+            setattr(instance, self.field_name, slug)
+
+            try:
+                with transaction.atomic():
+                    return save()
+            except IntegrityError:
+                clashed = self.model._default_manager.filter(**{self.field_name: slug}).exists()
+                if not clashed or attempt == attempts - 1:
+                    raise
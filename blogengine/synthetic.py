@@ -0,0 +1,123 @@
+"""
+Seeded generator of synthetic blog content for benchmarks.
+
+The same seed, counts and newest date always produce the same rows,
+publication dates included. Post texts are
+drawn from a pool of generated Markdown documents, each rendered once,
+so generating a million posts is dominated by the inserts.
+"""
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.models import Site
+from django.db import transaction
+from django.utils import timezone
+
+from blogengine.models import Category, Post
+from blogengine.rendering import render_markdown, source_hash
+from blogengine.signals import bulk_posts_created
+
+SCALES = {
+    'small': 1000,
+    'medium': 100000,
+    'large': 1000000,
+}
+
+# Publication date of the first synthetic post; later ones are older
+NEWEST = datetime.datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+         'incididunt ut labore et dolore magna aliqua python django markdown template '
+         'query index cache render page post category archive feed search').split()
+
+
+class Generator(object):
+    def __init__(self, seed=0, text_pool_size=500, newest=NEWEST):
+        self.rng = random.Random(seed)
+        self.newest = newest
+        self.texts = []
+
+        for i in range(text_pool_size):
+            text = self.document()
+            self.texts.append((text, render_markdown(text), source_hash(text)))
+
+    def words(self, low, high):
+        return ' '.join(self.rng.choice(WORDS) for i in range(self.rng.randint(low, high)))
+
+    def document(self):
+        paragraphs = []
+
+        for i in range(self.rng.randint(2, 8)):
+            paragraph = self.words(20, 80).capitalize()
+            if self.rng.random() < 0.5:
+                paragraph += ' [{0}](http://example.com/{1}/)'.format(self.words(1, 3), self.rng.randint(1, 1000))
+            if self.rng.random() < 0.5:
+                paragraph += ' *{0}*.'.format(self.words(1, 4))
+            paragraphs.append(paragraph)
+
+        return '\n\n'.join(paragraphs)
+
+    def generate(self, posts, categories=20, authors=10, sites=1, flatpages=5, batch_size=1000, stdout=None):
+        """
+        Create the given numbers of rows, reusing existing synthetic users,
+        sites and categories. Posts are numbered after any synthetic posts
+        already there, so generating twice adds to the data set.
+        """
+        # The current site comes first so that the public pages show posts
+        site_objects = [Site.objects.get_current()]
+        site_objects += [Site.objects.get_or_create(domain='site{0}.example.com'.format(number),
+                                                    defaults={'name': 'Synthetic site {0}'.format(number)})[0]
+                         for number in range(1, sites)]
+
+        author_ids = []
+        for number in range(authors):
+            username = 'author{0}'.format(number)
+            author = User.objects.filter(username=username).first()
+            if author is None:
+                author = User.objects.create_user(username, '{0}@example.com'.format(username))
+            author_ids.append(author.pk)
+
+        category_ids = []
+        for number in range(categories):
+            category, created = Category.objects.get_or_create(
+                slug='synthetic-{0}'.format(number),
+                defaults={'name': 'Synthetic {0}'.format(number), 'description': self.words(5, 15)}
+            )
+            category_ids.append(category.pk)
+
+        for number in range(flatpages):
+            page, created = FlatPage.objects.get_or_create(
+                url='/synthetic-{0}/'.format(number),
+                defaults={'title': 'Synthetic page {0}'.format(number), 'content': self.document()}
+            )
+            page.sites.add(*site_objects)
+
+        after_pk = Post.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        first = Post.objects.filter(slug__startswith='synthetic-post-').count()
+
+        for start in range(first, first + posts, batch_size):
+            batch = []
+
+            for number in range(start, min(start + batch_size, first + posts)):
+                text, rendered_text, text_hash = self.rng.choice(self.texts)
+                batch.append(Post(
+                    title=self.words(3, 8).capitalize(),
+                    slug='synthetic-post-{0}'.format(number),
+                    pub_date=self.newest - datetime.timedelta(minutes=number * 7),
+                    text=text,
+                    rendered_text=rendered_text,
+                    text_hash=text_hash,
+                    author_id=self.rng.choice(author_ids),
+                    site=self.rng.choice(site_objects),
+                    category_id=self.rng.choice(category_ids) if category_ids and self.rng.random() < 0.9 else None
+                ))
+
+            with transaction.atomic():
+                Post.objects.bulk_create(batch)
+
+            if stdout is not None:
+                stdout.write('{0} posts'.format(start + len(batch) - first))
+
+        bulk_posts_created(after_pk, category_ids)
@@ -1,19 +1,13 @@
-import markdown
-
 from django import template
 from django.template.defaultfilters import stringfilter
-from django.utils.encoding import force_text
 from django.utils.safestring import mark_safe
 
+from blogengine.rendering import render_markdown_cached
+
 register = template.Library()
 
 
 @register.filter(is_safe=True)
 @stringfilter
 def custom_markdown(value):
-    extensions = ["nl2br", ]
-
-    return mark_safe(markdown.markdown(force_text(value),
-                                       extensions,
-                                       safe_mode=True,
-                                       enable_attributes=False))
+    return mark_safe(render_markdown_cached(value))
@@ -0,0 +1,23 @@
+from django import template
+
+from blogengine import aggregates
+
+register = template.Library()
+
+
+def get_navigation(context):
+    # Shared by the tags of one template, so a page makes one cache lookup
+    if 'blogengine_navigation' not in context.render_context:
+        context.render_context['blogengine_navigation'] = aggregates.navigation()
+
+    return context.render_context['blogengine_navigation']
+
+
+@register.inclusion_tag('blogengine/includes/archive_navigation.html', takes_context=True)
+def archive_navigation(context):
+    return {'months': get_navigation(context)['months']}
+
+
+@register.inclusion_tag('blogengine/includes/category_navigation.html', takes_context=True)
+def category_navigation(context):
+    return {'categories': get_navigation(context)['categories']}
@@ -0,0 +1,77 @@
+"""
+Reading and writing posts as JSON Lines or CSV for the bulk import and
+export commands.
+"""
+import csv
+import io
+import json
+import sys
+
+from django.utils import six
+from django.utils.encoding import force_bytes, force_text
+
+FIELDS = (
+    'title',
+    'slug',
+    'pub_date',
+    'text',
+    'category',
+    'category_name',
+    'author',
+    'site',
+)
+
+FORMATS = ('jsonl', 'csv')
+
+
+def open_file(path, mode):
+    """
+    Open a file for the csv and json modules, '-' meaning stdin or stdout.
+    """
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+
+    if six.PY2:
+        return open(path, mode + 'b')
+
+    return io.open(path, mode, encoding='utf-8', newline='')
+
+
+def write_rows(stream, format, rows):
+    """
+    Write dicts keyed by FIELDS, returning how many were written.
+    """
+    count = 0
+
+    if format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        for row in rows:
+            values = [row[field] if row[field] is not None else '' for field in FIELDS]
+            writer.writerow([force_bytes(value) for value in values] if six.PY2 else values)
+            count += 1
+    else:
+        for row in rows:
+            line = json.dumps(row, ensure_ascii=False)
+            stream.write(force_bytes(line) + b'\n' if six.PY2 else line + '\n')
+            count += 1
+
+    return count
+
+
+def read_rows(stream, format):
+    """
+    Yield dicts keyed by FIELDS; missing or empty values are None.
+    """
+    if format == 'csv':
+        reader = csv.reader(stream)
+        header = [force_text(name) for name in next(reader)]
+        for values in reader:
+            row = dict(zip(header, (force_text(value) for value in values)))
+            yield dict((field, row.get(field) or None) for field in FIELDS)
+    else:
+        for line in stream:
+            line = force_text(line).strip()
+            if line:
+                row = json.loads(line)
+                yield dict((field, row.get(field) or None) for field in FIELDS)
@@ -1,23 +1,44 @@
-from blogengine.views import CategoryListView
+from blogengine import feeds, metrics, sitemaps
+from blogengine.routers import replica_reads
+from blogengine.views import ArchiveView, CategoryListView, PostDetailView, PostListView, SearchView
 from django.conf.urls import patterns, url
-from django.views.generic import ListView, DetailView
-from blogengine.models import Post, Category
+from blogengine.models import Category
 
 urlpatterns = patterns('',
     # Index
-    url(r'^(?P<page>\d+)?/?$', ListView.as_view(
-        model=Post,
+    url(r'^(?P<page>\d+)?/?$', replica_reads(PostListView.as_view(
         paginate_by=5
-    )),
+    )), name='blog_index'),
+
+    # Archives
+    url(r'^archive/(?P<year>\d{4})/?$', replica_reads(ArchiveView.as_view(
+        paginate_by=5
+    )), name='blog_archive_year'),
+    url(r'^archive/(?P<year>\d{4})/(?P<month>\d{1,2})/?$', replica_reads(ArchiveView.as_view(
+        paginate_by=5
+    )), name='blog_archive_month'),
 
     # Individual posts
-    url(r'^(?P<pub_date__year>\d{4})/(?P<pub_date__month>\d{1,2})/(?P<slug>[a-zA-Z0-9-]+)/?$', DetailView.as_view(
-        model=Post
-    )),
+    url(r'^(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<slug>[a-zA-Z0-9-]+)/?$', replica_reads(PostDetailView.as_view()), name='blog_post'),
 
     # Categories
-    url(r'^category/(?P<slug>[a-zA-Z0-9-]+)/?$', CategoryListView.as_view(
+    url(r'^category/(?P<slug>[a-zA-Z0-9-]+)(?:/(?P<page>\d+))?/?$', replica_reads(CategoryListView.as_view(
         paginate_by=5,
         model=Category
-    ))
+    )), name='blog_category'),
+
+    # Search
+    url(r'^search/$', replica_reads(SearchView.as_view()), name='blog_search'),
+
+    # Sitemaps
+    url(r'^sitemap\.xml$', sitemaps.sitemap_index, name='blog_sitemap'),
+    url(r'^sitemap-pages\.xml$', sitemaps.sitemap_pages, name='blog_sitemap_pages'),
+    url(r'^sitemap-posts-(?P<shard>\d+)\.xml$', sitemaps.sitemap_posts, name='blog_sitemap_posts'),
+
+    # Metrics
+    url(r'^metrics$', metrics.metrics_view, name='blog_metrics'),
+
+    # Feeds
+    url(r'^feeds/(?P<format>atom|rss)/(?P<archive>all/)?$', feeds.site_feed, name='blog_feed'),
+    url(r'^feeds/category/(?P<slug>[a-zA-Z0-9-]+)/(?P<format>atom|rss)/(?P<archive>all/)?$', feeds.category_feed, name='blog_category_feed')
 )
@@ -1,14 +1,376 @@
-from blogengine.models import Category, Post
-from django.shortcuts import render
-from django.views.generic import ListView
+import datetime
 
+from blogengine import aggregates, instrumentation, pagecache, search
+from blogengine.lookups import category_slugs, flatpage_table
+from blogengine.models import Post
+from blogengine.pagination import InvalidCursor, KeysetPage, KeysetPaginator
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.flatpages.views import render_flatpage
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.paginator import EmptyPage
+from django.db import connections, router
+from django.http import Http404, HttpResponsePermanentRedirect, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.views.generic import DetailView, ListView, TemplateView
 
-class CategoryListView(ListView):
-    def get_queryset(self):
-        slug = self.kwargs['slug']
+
+def month_range(year, month):
+    """
+    Return the start of the given month and of the next one, in the
+    current time zone.
+    """
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+
+    if settings.USE_TZ:
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(start, tz)
+        end = timezone.make_aware(end, tz)
+
+    return start, end
+
+
+def year_range(year):
+    """
+    Return the start of the given year and of the next one, in the
+    current time zone.
+    """
+    start, _ = month_range(year, 1)
+    _, end = month_range(year, 12)
+
+    return start, end
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudgetMixin(object):
+    """
+    Declares the number of queries a view may run.
+
+    With BLOGENGINE_ENFORCE_QUERY_BUDGETS on (as in the tests) a request
+    that runs more queries than the budget, template rendering included,
+    raises QueryBudgetExceeded.
+    """
+    query_budget = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.query_budget is None or not getattr(settings, 'BLOGENGINE_ENFORCE_QUERY_BUDGETS', False):
+            return super(QueryBudgetMixin, self).dispatch(request, *args, **kwargs)
+
+        from django.test.utils import CaptureQueriesContext
+
+        # The connection reads go to, which is the replica for public views
+        with CaptureQueriesContext(connections[router.db_for_read(Post) or 'default']) as queries:
+            response = super(QueryBudgetMixin, self).dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+
+        if len(queries) > self.query_budget:
+            raise QueryBudgetExceeded('{0} ran {1} queries, over its budget of {2}:\n{3}'.format(
+                self.__class__.__name__,
+                len(queries),
+                self.query_budget,
+                '\n'.join(query['sql'] for query in queries.captured_queries)
+            ))
+
+        return response
+
+
+class KeysetPaginationMixin(object):
+    """
+    Paginates a ListView by cursor instead of page number.
+
+    Set BLOGENGINE_PAGINATION_MODE to 'offset' to go back to Django's
+    numbered pages. In keyset mode numbered page URLs are not found, rather
+    than every number serving the first page.
+    """
+    cursor_kwarg = 'cursor'
+    pagination_mode = None
+
+    def get_pagination_mode(self):
+        return self.pagination_mode or getattr(settings, 'BLOGENGINE_PAGINATION_MODE', 'keyset')
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != 'keyset':
+            return super(KeysetPaginationMixin, self).paginate_queryset(queryset, page_size)
+
+        if self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg):
+            raise Http404("Pages are addressed by cursor.")
+
+        paginator = KeysetPaginator(queryset, page_size)
+
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        except EmptyPage:
+            raise Http404("No posts beyond this page cursor.")
+
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_page_number_url(self, number):
+        return '?{0}={1}'.format(self.page_kwarg, number)
+
+    def get_page_url(self, page, previous=False):
+        if isinstance(page, KeysetPage):
+            cursor = page.previous_cursor if previous else page.next_cursor
+            return '?{0}={1}'.format(self.cursor_kwarg, cursor)
+
+        if previous:
+            return self.get_page_number_url(page.previous_page_number())
+
+        return self.get_page_number_url(page.next_page_number())
+
+    def get_context_data(self, **kwargs):
+        context = super(KeysetPaginationMixin, self).get_context_data(**kwargs)
+        page = context.get('page_obj')
+
+        if page is not None:
+            if page.has_previous():
+                context['previous_page_url'] = self.get_page_url(page, previous=True)
+            if page.has_next():
+                context['next_page_url'] = self.get_page_url(page)
+
+        return context
+
+
+class PageCacheMixin(object):
+    """
+    Tags the response for the page cache with the posts and categories it
+    shows, and the navigation every page carries. Subclasses add tags for
+    the lists the page belongs to.
+    """
+    cache_tags = ()
+
+    def get_cache_posts(self, context):
+        return context['object_list']
+
+    def get_cache_tags(self, context):
+        tags = set(self.cache_tags)
+        tags.add('navigation')
+
+        for post in self.get_cache_posts(context):
+            tags.add('post:{0}'.format(post.pk))
+            if post.category_id is not None:
+                tags.add('category:{0}'.format(post.category_id))
+
+        return tags
+
+    def get_cache_timeout(self):
+        """
+        Seconds the page cache keeps the page, None for no expiry.
+        """
+        return DEFAULT_TIMEOUT
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super(PageCacheMixin, self).render_to_response(context, **response_kwargs)
+        posts = self.get_cache_posts(context)
+        last_modified = max(post.pub_date for post in posts) if posts else None
+
+        return pagecache.tag_response(response, self.get_cache_tags(context), last_modified,
+                                      self.get_cache_timeout())
+
+
+class PostListView(QueryBudgetMixin, PageCacheMixin, KeysetPaginationMixin, ListView):
+    queryset = Post.objects.for_listing()
+    query_budget = 1
+    cache_tags = ('index', )
+
+    def get_page_number_url(self, number):
+        return '/{0}/'.format(number)
+
+
+class PostDetailView(QueryBudgetMixin, PageCacheMixin, DetailView):
+    queryset = Post.objects.for_listing()
+    # Named explicitly: the deferred fields make the object an instance of
+    # a proxy model, whose name DetailView would otherwise use
+    template_name = 'blogengine/post_detail.html'
+    context_object_name = 'post'
+    query_budget = 1
+
+    def get_cache_posts(self, context):
+        return [context['object']]
+
+    def get_object(self, queryset=None):
+        """
+        Look the post up by slug within its month.
+
+        The month is matched as a half-open pub_date range rather than
+        with year/month lookups, which wrap the column in a date function
+        and so cannot use the (slug, pub_date) index.
+        """
+        if queryset is None:
+            queryset = self.get_queryset()
+
+        try:
+            start, end = month_range(int(self.kwargs['year']), int(self.kwargs['month']))
+        except ValueError:
+            raise Http404("Invalid date.")
 
         try:
-            category = Category.objects.get(slug=slug)
-            return Post.objects.filter(category=category)
-        except Category.DoesNotExist:
+            return queryset.get(slug=self.kwargs['slug'], pub_date__gte=start, pub_date__lt=end)
+        except Post.DoesNotExist:
+            raise Http404("No post found matching the query.")
+
+
+class CategoryListView(QueryBudgetMixin, PageCacheMixin, KeysetPaginationMixin, ListView):
+    # One query for the posts, plus one when the slug map is (re)loaded
+    query_budget = 2
+
+    def get_queryset(self):
+        category_id = category_slugs.get(self.kwargs['slug'])
+
+        if category_id is None:
+            # Creating or renaming a category brings the page to life
+            self.cache_tags = ('categories', )
             return Post.objects.none()
+
+        self.cache_tags = ('category:{0}'.format(category_id), )
+
+        return Post.objects.for_listing().filter(category_id=category_id)
+
+    def get_page_number_url(self, number):
+        return '/category/{0}/{1}/'.format(self.kwargs['slug'], number)
+
+
+class ArchiveView(QueryBudgetMixin, PageCacheMixin, KeysetPaginationMixin, ListView):
+    """
+    Posts published in a year, or in a month when the URL gives one.
+
+    Periods without posts are answered from the navigation counts without
+    a query, so a period's first post shows up here when they do. Once a
+    period is over its pages only change when one of its posts is edited,
+    so they are kept in the page cache for BLOGENGINE_ARCHIVE_CACHE_TIMEOUT
+    seconds and sent with a long max-age.
+    """
+    template_name = 'blogengine/post_archive.html'
+    query_budget = 1
+
+    def get_period(self):
+        year = int(self.kwargs['year'])
+        month = self.kwargs.get('month')
+
+        try:
+            if month is None:
+                return (year, ), year_range(year)
+            return (year, int(month)), month_range(year, int(month))
+        except ValueError:
+            raise Http404("Invalid date.")
+
+    def get(self, request, *args, **kwargs):
+        self.period, (self.start, self.end) = self.get_period()
+
+        months = [month for month, count in aggregates.navigation()['months']]
+        if not any((month.year, month.month)[:len(self.period)] == self.period for month in months):
+            raise Http404("No posts in this period.")
+
+        self.cache_tags = (aggregates.archive_tag(*self.period), )
+
+        return super(ArchiveView, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Post.objects.for_listing().filter(pub_date__gte=self.start, pub_date__lt=self.end)
+
+    def is_closed(self):
+        return self.end <= timezone.now()
+
+    def get_cache_timeout(self):
+        if self.is_closed():
+            # Capped: a per-process page cache only sees this worker's edits
+            return getattr(settings, 'BLOGENGINE_ARCHIVE_CACHE_TIMEOUT', 24 * 60 * 60)
+
+        return DEFAULT_TIMEOUT
+
+    def get_context_data(self, **kwargs):
+        context = super(ArchiveView, self).get_context_data(**kwargs)
+        context['period_start'] = self.start
+        context['is_month'] = len(self.period) == 2
+
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super(ArchiveView, self).render_to_response(context, **response_kwargs)
+
+        if self.is_closed():
+            patch_cache_control(response, public=True,
+                                max_age=getattr(settings, 'BLOGENGINE_ARCHIVE_MAX_AGE', 365 * 24 * 60 * 60))
+
+        return response
+
+
+class SearchView(QueryBudgetMixin, TemplateView):
+    """
+    Ranked full-text search over post titles and text.
+    """
+    template_name = 'blogengine/search.html'
+    paginate_by = 5
+    # One query for the ranked ids, one for the posts
+    query_budget = 2
+
+    def get_context_data(self, **kwargs):
+        context = super(SearchView, self).get_context_data(**kwargs)
+        query = self.request.GET.get('q', '')
+
+        try:
+            page = int(self.request.GET.get('page', 1))
+        except ValueError:
+            raise Http404("Invalid page.")
+        if page < 1:
+            raise Http404("Invalid page.")
+
+        # One extra id tells whether there is a next page without a COUNT
+        # The same database as the post lookup and the query budget
+        backend = search.get_backend(router.db_for_read(Post) or 'default')
+        pks = backend.search(query, (page - 1) * self.paginate_by, self.paginate_by + 1)
+        posts = Post.objects.for_listing().in_bulk(pks[:self.paginate_by]) if pks else {}
+
+        context.update({
+            'query': query,
+            'object_list': [posts[pk] for pk in pks[:self.paginate_by] if pk in posts],
+            'previous_page_url': self.get_page_url(query, page - 1) if page > 1 else None,
+            'next_page_url': self.get_page_url(query, page + 1) if len(pks) > self.paginate_by else None,
+        })
+
+        return context
+
+    def get_page_url(self, query, page):
+        return '?{0}'.format(urlencode({'q': query, 'page': page}))
+
+
+def flatpage(request, url):
+    """
+    django.contrib.flatpages' view, finding pages in the flatpage table
+    so URLs that are not flatpages are answered without a query.
+    """
+    if not url.startswith('/'):
+        url = '/' + url
+    site_id = get_current_site(request).id
+
+    pk = flatpage_table.get(url, site_id)
+    if pk is None:
+        if not url.endswith('/') and settings.APPEND_SLASH and flatpage_table.get(url + '/', site_id) is not None:
+            return HttpResponsePermanentRedirect('{0}/'.format(request.path))
+        raise Http404
+
+    response = render_flatpage(request, get_object_or_404(FlatPage, pk=pk))
+
+    return pagecache.tag_response(response, ['flatpages', 'navigation'])
+
+
+@staff_member_required
+def profile_stats(request):
+    """
+    Per-route timings and recent sampled profiles of this process.
+    """
+    if request.method == 'POST' and request.POST.get('reset'):
+        instrumentation.aggregates.reset()
+
+    return JsonResponse(instrumentation.aggregates.snapshot())
@@ -0,0 +1,215 @@
+"""
+Worker start-up: warm-up and a report of where the time goes.
+
+With BLOGENGINE_WARMUP set, wsgi.py does the work the first request
+would otherwise pay for before the worker takes traffic: loading the
+middleware, compiling the URL patterns and templates, importing Markdown
+and its extensions, loading translations and the static files manifest,
+and connecting to each database. Connections are closed again at the
+end, so under gunicorn --preload the warm state is shared copy-on-write
+by the workers and no connection crosses a fork. To have each preloaded
+worker connect before it accepts requests too, use post_fork in the
+gunicorn config file:
+
+    from blogengine.warmup import post_fork
+
+With BLOGENGINE_STARTUP_REPORT set, wsgi.py writes the time of each
+start-up step and of the slowest imports to stderr; `manage.py
+startup_report` runs that in a fresh process.
+
+Nothing here imports Django at module level, so wsgi.py can time
+Django's own imports.
+"""
+import contextlib
+import os
+import sys
+import time
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+# Compiled up front. Parent and included templates are listed too, as
+# they are only loaded when a page is first rendered.
+TEMPLATES = (
+    'blogengine/includes/base.html',
+    'blogengine/includes/archive_navigation.html',
+    'blogengine/includes/category_navigation.html',
+    'blogengine/post_list.html',
+    'blogengine/post_detail.html',
+    'blogengine/post_archive.html',
+    'blogengine/search.html',
+    'flatpages/default.html',
+)
+
+# Resolved once each so every URL pattern's regex is compiled
+PATHS = ('/', '/archive/2015/', '/archive/2015/1/', '/2015/1/post/', '/category/category/', '/search/',
+         '/feeds/atom/', '/sitemap.xml', '/metrics')
+
+
+class ImportTimer(object):
+    """
+    Times every module imported while installed, both including and
+    excluding the imports it triggers.
+    """
+    def __init__(self):
+        self.timings = {}
+        self._stack = []
+        self._original = None
+
+    def install(self):
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=-1 if sys.version_info[0] < 3 else 0):
+        module = name
+        if level > 0 and globals:
+            # Relative import: name it after the importing package
+            package = globals.get('__package__') or globals.get('__name__', '')
+            module = '.'.join(part for part in (package, name) if part)
+
+        if module in sys.modules or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        started = time.time()
+        self._stack.append(0.0)
+
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - started
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+
+            total, own = self.timings.get(module, (0.0, 0.0))
+            self.timings[module] = (total + elapsed, own + elapsed - nested)
+
+    def slowest(self, count):
+        """
+        Return the count modules with the most time of their own, as
+        (name, total seconds, own seconds).
+        """
+        ordered = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)
+
+        return [(name, total, own) for name, (total, own) in ordered[:count]]
+
+
+class StartupReport(object):
+    def __init__(self, time_imports=False):
+        self.started = time.time()
+        self.total = None
+        self.steps = []
+        self.imports = None
+
+        if time_imports:
+            self.imports = ImportTimer()
+            self.imports.install()
+
+    @classmethod
+    def from_environ(cls):
+        return cls(time_imports=bool(os.environ.get('BLOGENGINE_STARTUP_REPORT')))
+
+    @contextlib.contextmanager
+    def step(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.time() - started))
+
+    def finish(self, stream=None):
+        """
+        Stop timing imports and, if they were being timed, write the report.
+        """
+        self.total = time.time() - self.started
+
+        if self.imports is not None:
+            self.imports.uninstall()
+            (stream or sys.stderr).write(self.format())
+
+    def format(self, imports=25):
+        total = self.total if self.total is not None else time.time() - self.started
+        lines = ['Worker start-up in {0:.1f} ms (pid {1})'.format(total * 1000, os.getpid())]
+
+        for name, seconds in self.steps:
+            lines.append('  {0:<24} {1:>9.1f} ms'.format(name, seconds * 1000))
+
+        if self.imports is not None:
+            lines.append('Slowest imports          total ms    own ms')
+            for name, total, own in self.imports.slowest(imports):
+                lines.append('  {0:<24} {1:>9.1f} {2:>9.1f}'.format(name, total * 1000, own * 1000))
+
+        return '\n'.join(lines) + '\n'
+
+
+def warm_up(handler=None, report=None, connect=True):
+    """
+    Do the first request's one-off work now. handler is the WSGI
+    application, whose middleware is loaded. connect=False leaves the
+    databases alone.
+    """
+    from django.conf import settings
+    from django.core import urlresolvers
+    from django.db import connections
+    from django.template import loader
+    from django.utils import translation
+
+    from blogengine import context_processors, metrics, rendering
+
+    report = report or StartupReport()
+
+    if handler is not None and handler._request_middleware is None:
+        with report.step('middleware'):
+            handler.load_middleware()
+
+    with report.step('url patterns'):
+        resolver = urlresolvers.get_resolver(None)
+        resolver.reverse_dict
+        for path in PATHS:
+            try:
+                resolver.resolve(path)
+            except urlresolvers.Resolver404:
+                pass
+
+    with report.step('translations'):
+        translation.activate(settings.LANGUAGE_CODE)
+        translation.deactivate()
+
+    with report.step('templates'):
+        for name in TEMPLATES:
+            loader.get_template(name)
+
+    with report.step('markdown'):
+        rendering.render_markdown('Warm *up*\nwith line breaks')
+
+    with report.step('static files'):
+        context_processors.static_version()
+
+    if not connect:
+        return report
+
+    with report.step('databases'):
+        for connection in connections.all():
+            connection.ensure_connection()
+            # Nothing opened here may be inherited by forked workers
+            connection.close()
+            metrics.DB_CONNECTIONS_OPEN.set(0, alias=connection.alias)
+
+    return report
+
+
+def post_fork(server, worker):
+    """
+    gunicorn hook connecting a new worker to its databases.
+    """
+    from django.db import connections
+
+    for connection in connections.all():
+        connection.ensure_connection()
@@ -6,9 +6,11 @@ urlpatterns = patterns('',
     # url(r'^$', 'django_tutorial_blog_ng.views.home', name='home'),
     # url(r'^blog/', include('blog.urls')),
 
+    url(r'^admin/blog-stats/$', 'blogengine.views.profile_stats', name='blog_profile_stats'),
+
     url(r'^admin/', include(admin.site.urls)),
 
     url(r'', include('blogengine.urls')),
 
-    url(r'', include('django.contrib.flatpages.urls')),
+    url(r'^(?P<url>.*/)$', 'blogengine.views.flatpage', name='blog_flatpage'),
 )
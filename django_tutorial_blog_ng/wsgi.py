@@ -3,6 +3,13 @@ WSGI config for django_tutorial_blog_ng project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+Set BLOGENGINE_WARMUP to do the first request's one-off work while the
+worker starts, and BLOGENGINE_STARTUP_REPORT to print where start-up time
+goes (see blogengine.warmup).
+
+The collected static files in STATIC_ROOT are served in front of Django,
+precompressed and with long-lived caching (see blogengine.assets).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/1.7/howto/deployment/wsgi/
 """
@@ -10,5 +17,17 @@ https://docs.djangoproject.com/en/1.7/howto/deployment/wsgi/
 import os
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_tutorial_blog_ng.settings")
 
+from blogengine import warmup
+startup = warmup.StartupReport.from_environ()
+
 from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
+with startup.step('django setup'):
+    application = get_wsgi_application()
+
+if os.environ.get('BLOGENGINE_WARMUP'):
+    warmup.warm_up(application, startup)
+
+from blogengine.assets import StaticFilesApplication
+application = StaticFilesApplication(application)
+
+startup.finish()